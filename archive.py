@@ -0,0 +1,65 @@
+import table_operations as to
+import game_calendar
+import game_parameters.constants as c
+
+"""
+Archive
+
+Horses are never deleted, so without an archive the horses table (and horse_properties and
+race_results with it) only ever grows, and every query for the living horses has to step
+over all of the dead ones. archive moves the rows of horses that are long dead into the
+archived_ copies of those tables (see table_operations.ARCHIVED_TABLES), so that the tables
+the game works with stay about the size of the living population. Game calls it every
+ARCHIVE_INTERVAL days.
+
+Nothing is lost: the view all_<table> (e.g. all_horses) is the table and its archived copy
+together. Anything that may need a dead horse (pedigrees, horse info, race records,
+names in messages) reads the view, anything that only needs the living reads the table.
+
+A horse is only archived once nothing in the game can change it any more: it has died,
+the day it was expected to die has passed and it isn't carrying a foal. The horse (and
+race result) with the highest id is never archived, since new ids are one more than the
+highest id in the table.
+"""
+
+ARCHIVABLE = """
+death_date IS NOT NULL AND expected_death < ? AND due_date IS NULL
+AND horse_id < (SELECT MAX(horse_id) FROM horses)
+"""
+
+
+def archive(day, race_results=c.ARCHIVE_RACE_RESULTS):
+    """
+    Move the horses which are long dead, and their properties, to the archived tables.
+    Args:
+        day (datetime): Current day.
+        race_results (bool): If True, the race results of the horses are archived too.
+
+    Returns:
+        int. The number of horses archived.
+    """
+    to.cursor.execute("DROP TABLE IF EXISTS temp.archiving")
+    to.cursor.execute(f"CREATE TEMP TABLE archiving AS SELECT horse_id FROM horses WHERE {ARCHIVABLE}",
+                      [game_calendar.day_number(day)])
+    number = to.cursor.execute("SELECT COUNT(*) FROM archiving").fetchone()[0]
+
+    if number > 0:
+        _move('horses', "horse_id IN (SELECT horse_id FROM archiving)")
+        _move('horse_properties', "horse_id IN (SELECT horse_id FROM archiving)")
+        if race_results:
+            _move('race_results', "horse_id IN (SELECT horse_id FROM archiving)"
+                                  " AND result_id < (SELECT MAX(result_id) FROM race_results)")
+        # Dead horses don't race again, so their last races are no longer needed
+        to.cursor.execute("DELETE FROM last_races WHERE horse_id IN (SELECT horse_id FROM archiving)")
+
+    to.cursor.execute("DROP TABLE temp.archiving")
+    to.db.commit()
+    return number
+
+
+def _move(table, condition):
+    """Move the rows of a table matching the condition to its archived copy. The columns
+    are matched by name, since the two tables may have them in different orders."""
+    columns = ', '.join(to.column_names(table))
+    to.cursor.execute(f"INSERT INTO archived_{table} ({columns}) SELECT {columns} FROM {table} WHERE {condition}")
+    to.cursor.execute(f"DELETE FROM {table} WHERE {condition}")
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+import numpy as np
+import pandas as pd
+import game_parameters.constants as c
+
+"""
+Headless batch simulation
+
+Runs many independent games at once without a gui so that the values in constants.py can
+be tuned. Every game runs in its own process against its own SQLite file, starting either
+from a copy of a save or from a freshly generated history. When the games finish, a
+summary of the state of each is collected into a DataFrame.
+
+From the command line (run from the repository folder):
+    python batch_runner.py --runs 8 --days 365 --save 20yr_start_game_data.db
+    python batch_runner.py --runs 8 --days 365 --history-days 3650 --set RACE_PROBABILITY=0.5
+
+Or from python:
+    results = batch_runner.run_batch(8, 365, save='20yr_start_game_data.db')
+    batch_runner.summarize(results)
+"""
+
+# Modules which take a copy of the constants with 'from game_parameters.constants import *'
+# and so need overridden values set on them directly.
+CONSTANT_USERS = ['horse_functions', 'owner_functions', 'estate', 'phenotype', 'genetics']
+# Functions (module, name) whose cached results depend on the constants, and so are
+# cleared when they are overridden.
+CACHED_FUNCTIONS = [('genetics', 'allele_activity'), ('genetics', 'allele_name'),
+                    ('coat_table', 'allele_code')]
+
+
+def run_batch(runs, days, save=None, seed=None, history_days=0, starting_horses=25,
+              overrides=None, processes=None, fast_forward=True, workdir=None):
+    """
+    Run several independent games in parallel and summarize how each one ended up.
+    Args:
+        runs (int): Number of games to run.
+        days (int): Number of days to run each game for.
+        save (str or None): Name of a save (in the saves folder) or path to a database
+            to start every game from. If None, each game will generate its own history.
+        seed (int or None): Seed of the first game; game i uses seed + i. If None, a
+            random seed is picked.
+        history_days (int): Days of history to generate when there is no save.
+        starting_horses (int): Number of horses to generate history with when there is
+            no save.
+        overrides (dict or None): Names and values of constants to change in every game.
+        processes (int or None): Number of worker processes. If None, uses one per CPU.
+        fast_forward (bool): If True, will fast-forward through quiet days.
+        workdir (str or None): Folder to keep the games' databases in while they run.
+            If None, a temporary folder is used.
+
+    Returns:
+        pd.DataFrame. One row per game with the seed, run time and summary statistics.
+    """
+    overrides = overrides or {}
+    for name in overrides:
+        if not hasattr(c, name):
+            raise ValueError(f"There is no constant called {name} to override.")
+    if save is not None and not os.path.exists(save):
+        save = os.path.join(os.path.dirname(__file__), 'saves', save)
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**31)
+
+    with tempfile.TemporaryDirectory(dir=workdir) as folder:
+        jobs = [{'run': i, 'seed': seed + i, 'days': days, 'save': save,
+                 'history_days': history_days, 'starting_horses': starting_horses,
+                 'overrides': overrides, 'fast_forward': fast_forward,
+                 'database': os.path.join(folder, f'run_{i}.db')} for i in range(runs)]
+        # Spawned (rather than forked) workers never share the parent's SQLite connection
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes) as pool:
+            results = pool.map(_run_game, jobs)
+    return pd.DataFrame(results).set_index('run')
+
+
+def summarize(results):
+    """Return the mean, spread and range of each summary statistic across the games."""
+    return results.drop(columns=['seed']).describe().T
+
+
+def apply_overrides(overrides):
+    """Change the values of constants in this process.
+
+    Args:
+        overrides (dict): Names and new values of constants.
+    """
+    for name, value in overrides.items():
+        setattr(c, name, value)
+        for module_name in CONSTANT_USERS:
+            module = sys.modules.get(module_name)
+            if module is not None and hasattr(module, name):
+                setattr(module, name, value)
+    for module_name, function_name in CACHED_FUNCTIONS:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            getattr(module, function_name).cache_clear()
+
+
+def game_summary(game):
+    """
+    Return statistics describing the current state of a game.
+    Args:
+        game (game_loop.Game): The game to describe.
+
+    Returns:
+        dict.
+    """
+    import table_operations as to
+    import owner_functions as of
+
+    def scalar(query, params=()):
+        return to.cursor.execute(query, params).fetchone()[0]
+
+    ai_money = [of.money(o) for o in game.ai_owners]
+    return {
+        'day': str(game.day.date()),
+        'living_horses': scalar("SELECT COUNT(*) FROM horses WHERE death_date IS NULL"),
+        'total_horses': scalar("SELECT COUNT(*) FROM all_horses"),
+        'pregnant_horses': scalar(
+            "SELECT COUNT(*) FROM horses WHERE death_date IS NULL AND due_date IS NOT NULL"),
+        'races': scalar("SELECT COUNT(*) FROM races"),
+        'mean_speed': scalar(
+            "SELECT AVG(p.speed) FROM horse_properties p"
+            " INNER JOIN horses h ON p.horse_id = h.horse_id WHERE h.death_date IS NULL"),
+        'player_money': float(of.money(game.owner)),
+        'player_horses': len(game.living_horses(game.owner)),
+        'mean_ai_money': float(np.mean(ai_money)) if ai_money else 0.,
+        'ai_horses': scalar(
+            f"SELECT COUNT(*) FROM horses WHERE death_date IS NULL"
+            f" AND owner_id NOT IN (?, ?)", (game.wild, game.owner)),
+        'messages': game.gui.messages,
+    }
+
+
+def _run_game(job):
+    """Run a single game in a worker process and return its summary."""
+    import table_operations as to
+    from game_loop import Game, HeadlessPrinter
+    apply_overrides(job['overrides'])
+
+    if job['save'] is not None:
+        shutil.copyfile(job['save'], job['database'])
+    to.connect(job['database'])
+
+    game = Game(None, restart=job['save'] is None, seed=job['seed'])
+    game.gui = HeadlessPrinter(game)
+    if job['save'] is None:
+        game.generate_history(job['history_days'], job['starting_horses'])
+    game.automated = False
+
+    start = time.time()
+    game.run_days(job['days'], fast_forward=job['fast_forward'])
+    summary = {'run': job['run'], 'seed': job['seed'], 'seconds': time.time() - start}
+    summary.update(game_summary(game))
+    to.db.commit()
+    to.db.close()
+    return summary
+
+
+def _parse_override(text):
+    """Turn 'NAME=VALUE' into (NAME, VALUE), reading VALUE as JSON where possible."""
+    name, value = text.split('=', 1)
+    try:
+        value = json.loads(value)
+    except json.JSONDecodeError:
+        pass
+    return name, value
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Run several games without a gui.')
+    parser.add_argument('--runs', type=int, default=4, help='Number of games to run.')
+    parser.add_argument('--days', type=int, default=365, help='Days to run each game for.')
+    parser.add_argument('--save', help='Save to start from. If omitted, history is generated.')
+    parser.add_argument('--seed', type=int, help='Seed of the first game.')
+    parser.add_argument('--history-days', type=int, default=0,
+                        help='Days of history to generate when there is no save.')
+    parser.add_argument('--starting-horses', type=int, default=25,
+                        help='Horses to generate history with when there is no save.')
+    parser.add_argument('--processes', type=int, help='Number of worker processes.')
+    parser.add_argument('--stepwise', action='store_true',
+                        help='Step through every day rather than fast-forwarding.')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a constant, e.g. --set RACE_PROBABILITY=0.5')
+    parser.add_argument('--output', help='CSV file to write the per-game results to.')
+    args = parser.parse_args(args)
+
+    results = run_batch(
+        args.runs, args.days, save=args.save, seed=args.seed, history_days=args.history_days,
+        starting_horses=args.starting_horses, overrides=dict(map(_parse_override, args.set)),
+        processes=args.processes, fast_forward=not args.stepwise)
+    if args.output:
+        results.to_csv(args.output)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(results)
+        print(summarize(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+import os
+import sys
+import json
+import time
+import shutil
+import cProfile
+import pstats
+import argparse
+import platform
+import tempfile
+import datetime
+import contextlib
+from collections import Counter
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_FOLDER)
+
+import table_operations as to
+import horse_functions as hf
+import owner_functions as of
+import phenotype as phe
+import league_stats
+import query_profiler
+from game_loop import Game, HeadlessPrinter
+
+"""
+Benchmarks
+
+Times the hot paths of the simulation so that changes to them can be checked for
+regressions. Every benchmark runs against its own temporary database, starting either from
+an empty game or from a copy of saves/20yr_start_game_data.db, and the game is seeded so
+that every run does exactly the same work.
+
+Each benchmark is timed (without profiling) and then run once more under cProfile and the
+query profiler (see query_profiler), which gives the number of calls made to each function
+in the repository and the number of SQL statements executed. Since the work is seeded,
+the counts only change when the code does, while the times move around a little from
+run to run.
+
+From the repository folder:
+    python -m benchmarks.run_benchmarks                          # run and print the results
+    python -m benchmarks.run_benchmarks --save-baseline          # store as the baseline
+    python -m benchmarks.run_benchmarks --compare                # flag regressions
+    python -m benchmarks.run_benchmarks --only race horse_value  # run some of them
+
+Results are written to benchmarks/results, which is not committed. The baseline is kept
+in benchmarks/baseline.json, which is, so that --compare works on a fresh checkout. The
+query and call counts in it hold on any machine, but its times are from the machine that
+saved it, so save a new baseline (or give a larger --tolerance) before comparing times
+measured elsewhere.
+"""
+
+SEED = 1234
+SAVE = os.path.join(REPO_FOLDER, 'saves', '20yr_start_game_data.db')
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+TOLERANCE = 0.25  # fraction that a benchmark can slow down by before it is flagged
+TOP_FUNCTIONS = 25  # number of functions whose call counts are recorded per benchmark
+
+
+def new_game(folder, from_save=True):
+    """
+    Start a seeded, headless game in its own database.
+    Args:
+        folder (str): Folder to keep the database in.
+        from_save (bool): If True, start from a copy of the 20 year save. Otherwise start
+            from an empty database.
+
+    Returns:
+        game_loop.Game.
+    """
+    path = os.path.join(folder, 'benchmark.db')
+    if os.path.exists(path):
+        os.remove(path)
+    if from_save:
+        shutil.copyfile(SAVE, path)
+    with contextlib.redirect_stdout(None):  # don't announce every table that is created
+        to.connect(path)
+        game = Game(None, restart=not from_save, seed=SEED)
+    game.gui = HeadlessPrinter(game)
+    game.automated = False
+    return game
+
+
+def living_horses(number):
+    """Return the IDs of (up to) the first number of living horses."""
+    query = f"SELECT horse_id FROM horses WHERE death_date IS NULL ORDER BY horse_id LIMIT {number}"
+    return [row[0] for row in to.cursor.execute(query).fetchall()]
+
+
+# Every benchmark is a function that takes a temporary folder, does any set up and returns
+# a function that does the work to be timed.
+
+
+def bench_generate_history(folder):
+    game = new_game(folder, from_save=False)
+    return lambda: game.generate_history(5 * 365, 25)
+
+
+def bench_run_days(folder):
+    game = new_game(folder)
+    return lambda: game.run_days(365)
+
+
+def bench_run_days_fast_forward(folder):
+    game = new_game(folder)
+    return lambda: game.run_days(365, fast_forward=True)
+
+
+def bench_update_properties(folder):
+    new_game(folder)
+    return lambda: phe.update_properties(dead_too=False)
+
+
+def bench_race(folder):
+    game = new_game(folder)
+    return lambda: game.race(horse_ids='random')
+
+
+def bench_horse_value(folder):
+    game = new_game(folder)
+    horses = living_horses(50)
+
+    def work():
+        for h in horses:
+            of.horse_value(h, game.day)
+    return work
+
+
+def bench_pedigree(folder):
+    new_game(folder)
+    horses = living_horses(50)
+
+    def work():
+        for h in horses:
+            hf.pedigree(h)
+    return work
+
+
+def bench_convert_to_links(folder):
+    new_game(folder)
+    from text_operations import convert_to_links
+    horses = living_horses(50)
+    message = ' '.join(f"[horses:{h}] beat [owners:{i % 5 + 1}]." for i, h in enumerate(horses))
+    return lambda: convert_to_links(message)
+
+
+# name: (benchmark, number of timed repeats)
+BENCHMARKS = {
+    'generate_history': (bench_generate_history, 1),
+    'run_days': (bench_run_days, 1),
+    'run_days_fast_forward': (bench_run_days_fast_forward, 1),
+    'update_properties': (bench_update_properties, 3),
+    'race': (bench_race, 5),
+    'horse_value': (bench_horse_value, 3),
+    'pedigree': (bench_pedigree, 3),
+    'convert_to_links': (bench_convert_to_links, 3),
+}
+
+
+def time_benchmark(benchmark, repeats, folder):
+    """Return the shortest of several timings of the benchmark, in seconds."""
+    times = []
+    for _ in range(repeats):
+        work = benchmark(folder)
+        start = time.perf_counter()
+        work()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def count_benchmark(benchmark, folder):
+    """
+    Run the benchmark once while counting function calls and SQL statements.
+    Args:
+        benchmark (function): The benchmark to run.
+        folder (str): Temporary folder for the database.
+
+    Returns:
+        int. The number of SQL statements executed.
+        dict. The number of calls to each of the most called functions in the repository,
+            keyed by 'module.py:function'.
+    """
+    work = benchmark(folder)
+    query_profiler.enable()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        with contextlib.redirect_stdout(None):  # run_days prints the query report
+            work()
+    finally:
+        profiler.disable()
+        query_profiler.disable()
+    statements = sum(count for count, _, _ in query_profiler.PROFILER.stats.values())
+    query_profiler.PROFILER.reset()
+
+    calls = Counter()
+    for (filename, _, function), info in pstats.Stats(profiler).stats.items():
+        path = os.path.abspath(filename)
+        if not filename.endswith('.py') or not path.startswith(REPO_FOLDER):
+            continue  # builtins and libraries
+        if os.path.basename(path) == 'query_profiler.py':
+            continue  # only there to count the statements
+        if os.sep + 'benchmarks' + os.sep not in path:
+            calls[f"{os.path.relpath(path, REPO_FOLDER)}:{function}"] += info[1]
+    return statements, dict(calls.most_common(TOP_FUNCTIONS))
+
+
+def run(names=None):
+    """
+    Run the benchmarks.
+    Args:
+        names (list or None): Names of the benchmarks to run. If None, runs them all.
+
+    Returns:
+        dict. The results, ready to be written as JSON.
+    """
+    names = names or list(BENCHMARKS)
+    results = {'created': str(datetime.datetime.now()), 'python': platform.python_version(),
+               'seed': SEED, 'benchmarks': {}}
+    with tempfile.TemporaryDirectory() as folder:
+        for name in names:
+            benchmark, repeats = BENCHMARKS[name]
+            try:
+                seconds = time_benchmark(benchmark, repeats, folder)
+                queries, calls = count_benchmark(benchmark, folder)
+                league_stats.check()  # the running totals must agree with the races run
+            except ImportError as e:
+                # e.g. convert_to_links needs PyQt5
+                print(f"{name:<24} skipped ({e})")
+                continue
+            results['benchmarks'][name] = {'seconds': seconds, 'repeats': repeats,
+                                           'queries': queries, 'calls': calls}
+            print(f"{name:<24} {seconds:9.3f} s {queries:9d} queries")
+        to.db.close()
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """
+    Compare results against a baseline.
+    Args:
+        results (dict): Output of run.
+        baseline (dict): Output of an earlier run.
+        tolerance (float): Fraction that a benchmark can slow down by before it is flagged.
+
+    Returns:
+        list. A description of each regression found.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<24} {'baseline':>10} {'now':>10} {'change':>8} {'queries':>19}")
+    for name, now in results['benchmarks'].items():
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            print(f"{name:<24} (not in baseline)")
+            continue
+        change = now['seconds'] / before['seconds'] - 1 if before['seconds'] else 0.
+        print(f"{name:<24} {before['seconds']:10.3f} {now['seconds']:10.3f} {change:+8.0%} "
+              f"{before['queries']:9d} {now['queries']:9d}")
+        if change > tolerance:
+            regressions.append(f"{name} took {change:+.0%} longer "
+                               f"({before['seconds']:.3f} s -> {now['seconds']:.3f} s)")
+        if now['queries'] > before['queries']:
+            regressions.append(f"{name} ran {now['queries'] - before['queries']} more queries "
+                               f"({before['queries']} -> {now['queries']})")
+        for function, count in now['calls'].items():
+            if count > before['calls'].get(function, count):
+                regressions.append(f"{name} called {function} {count} times "
+                                   f"(was {before['calls'][function]})")
+    return regressions
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Time the hot paths of the simulation.')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), metavar='NAME',
+                        help=f"Benchmarks to run. Choose from: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--output', help='JSON file to write the results to.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='Store the results as the baseline to compare against.')
+    parser.add_argument('--compare', action='store_true',
+                        help='Compare the results against the stored baseline.')
+    parser.add_argument('--baseline', default=BASELINE, help='Location of the baseline.')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='Fraction a benchmark can slow down by before it is flagged.')
+    args = parser.parse_args(args)
+
+    results = run(args.only)
+    if args.output is None:
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        args.output = os.path.join(RESULTS_FOLDER, f'benchmarks_{stamp}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        shutil.copyfile(args.output, args.baseline)
+        print(f"Baseline written to {args.baseline}")
+    if args.compare:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('\nRegressions:')
+            for r in regressions:
+                print(f"  {r}")
+            sys.exit(1)
+        print('\nNo regressions.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import argparse
+import queue as queue_module
+import datetime
+import tempfile
+import contextlib
+import multiprocessing
+import pandas as pd
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_FOLDER)
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+"""
+Population stress test
+
+Runs generate_history with more and more starting horses to find out how the simulation
+scales with the size of the herd. Every size is run in a fresh process, so the peak
+memory use (RSS) of one size doesn't hide that of the next, and a size that takes too
+long can be abandoned without losing the others. For each size the wall time, peak RSS,
+size of the database and number of SQL statements per simulated day are recorded, along
+with the time spent in each phase of the day loop (see phase_profiler).
+
+From the repository folder:
+    python -m benchmarks.stress_population
+    python -m benchmarks.stress_population --sizes 25 250 2500 --days 365 --timeout 600
+
+The results are written to benchmarks/results as a CSV and, if matplotlib is installed,
+plotted against the number of horses on log-log axes. A straight line with a slope of 1
+is linear scaling; anything steeper is a cliff.
+"""
+
+SIZES = (25, 250, 2500, 25000)
+DAYS = 365
+TIMEOUT = 3600  # seconds to give each size before abandoning it
+SEED = 1234
+RESULTS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def stress(horses, days, folder, seed=SEED):
+    """
+    Generate history for a number of starting horses and measure the cost.
+    Args:
+        horses (int): Number of starting horses.
+        days (int): Days of history to generate.
+        folder (str): Folder to keep the database in.
+        seed (int): Seed for the game.
+
+    Returns:
+        dict. Measurements of the run.
+    """
+    import table_operations as to
+    import phase_profiler
+    from game_loop import Game, HeadlessPrinter
+
+    path = os.path.join(folder, f'stress_{horses}.db')
+    with contextlib.redirect_stdout(None):
+        to.connect(path)
+        game = Game(None, restart=True, seed=seed)
+    game.gui = HeadlessPrinter(game)
+    game.profiler = phase_profiler.PhaseProfiler()
+
+    # Only counted, since keeping every statement would add to the memory being measured
+    queries = 0
+
+    def count_query(statement):
+        nonlocal queries
+        queries += 1
+
+    to.db.set_trace_callback(count_query)
+    start = time.perf_counter()
+    game.generate_history(days, horses)
+    seconds = time.perf_counter() - start
+    to.db.set_trace_callback(None)
+    to.db.commit()
+
+    living = to.cursor.execute("SELECT COUNT(*) FROM horses WHERE death_date IS NULL").fetchone()[0]
+    total = to.cursor.execute("SELECT COUNT(*) FROM all_horses").fetchone()[0]  # Archived too
+    to.db.close()
+
+    result = {'horses': horses, 'days': days, 'seconds': seconds,
+              'seconds_per_day': seconds / max(days, 1),
+              'peak_rss_mb': peak_rss_mb(),
+              'database_mb': os.path.getsize(path) / 2**20,
+              'queries': queries, 'queries_per_day': queries / max(days, 1),
+              'final_living_horses': living, 'final_total_horses': total}
+    summary = game.profiler.summary()
+    for phase, phase_seconds in summary['total'].items():
+        result[f'phase_{phase}'] = phase_seconds
+    return result
+
+
+def peak_rss_mb():
+    """Return the peak resident memory of this process in MB (None if unknown)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+
+def _stress_in_process(queue, horses, days, folder, seed):
+    queue.put(stress(horses, days, folder, seed))
+
+
+def run(sizes=SIZES, days=DAYS, timeout=TIMEOUT, seed=SEED):
+    """
+    Stress every size, each in its own process.
+    Args:
+        sizes (list): Numbers of starting horses to try.
+        days (int): Days of history to generate for each.
+        timeout (float): Seconds to give each size. Sizes which take longer are recorded
+            as timed out (and larger sizes are still tried).
+        seed (int): Seed for the games.
+
+    Returns:
+        pd.DataFrame. One row per size.
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for horses in sizes:
+            queue = context.Queue()
+            process = context.Process(target=_stress_in_process,
+                                      args=(queue, horses, days, folder, seed))
+            process.start()
+            result = {'horses': horses, 'days': days, 'failed': 'timed out'}
+            deadline = time.time() + timeout
+            while time.time() < deadline:
+                try:
+                    result = queue.get(timeout=1)
+                    break
+                except queue_module.Empty:
+                    if not process.is_alive():
+                        result['failed'] = f'exit code {process.exitcode}'
+                        break
+            process.terminate()
+            process.join()
+            results.append(result)
+            print(', '.join(f'{k}={v:.4g}' if isinstance(v, float) else f'{k}={v}'
+                            for k, v in result.items() if not k.startswith('phase_')))
+    return pd.DataFrame(results).set_index('horses')
+
+
+def plot(results, path):
+    """
+    Plot the scaling curves (if matplotlib is installed).
+    Args:
+        results (pd.DataFrame): Output of run.
+        path (str): Image file to save the plot to.
+
+    Returns:
+        bool. True if the plot was made.
+    """
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not installed, so the results were not plotted.')
+        return False
+
+    measures = ['seconds', 'peak_rss_mb', 'database_mb', 'queries_per_day']
+    fig, axes = plt.subplots(1, len(measures), figsize=(5 * len(measures), 4))
+    for ax, measure in zip(axes, measures):
+        data = results[measure].dropna() if measure in results else pd.Series(dtype=float)
+        ax.loglog(data.index, data.values, 'o-')
+        ax.set_xlabel('starting horses')
+        ax.set_title(measure)
+        ax.grid(True, which='both', alpha=0.3)
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return True
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Stress generate_history with large herds.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES),
+                        help='Numbers of starting horses to try.')
+    parser.add_argument('--days', type=int, default=DAYS, help='Days of history to generate.')
+    parser.add_argument('--timeout', type=float, default=TIMEOUT,
+                        help='Seconds to give each size before abandoning it.')
+    parser.add_argument('--seed', type=int, default=SEED, help='Seed for the games.')
+    args = parser.parse_args(args)
+
+    results = run(args.sizes, args.days, args.timeout, args.seed)
+    os.makedirs(RESULTS_FOLDER, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    output = os.path.join(RESULTS_FOLDER, f'stress_population_{stamp}')
+    results.to_csv(f'{output}.csv')
+    print(f"Results written to {output}.csv")
+    if plot(results, f'{output}.png'):
+        print(f"Plot written to {output}.png")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import itertools
+from functools import lru_cache
+import numpy as np
+import genetics as ge
+import unsaved_phenotype as up
+from game_parameters.constants import GENES
+
+"""
+Coat color table
+
+The coat of a horse is worked out by the decision trees in unsaved_phenotype: its color by
+expressed_allele and coat_color, and its pattern by expressed_pattern_allele and
+hair_additions. These trees stay the one place the genetics of coats are written down.
+Walking a tree for every horse is slow, though, because every gene of every chromosome is
+hashed and then a dozen nested ifs are stepped through. Instead each tree is compiled once,
+when this module is imported, into tables of numbers:
+
+    pairs - For each gene, the code the two alleles of a horse express, indexed by the
+        number of each allele (its position in gene_alleles).
+    table - The name (its position in names) of every combination of expressed codes, one
+        axis per gene.
+
+Finding a color or pattern is then a handful of cached allele lookups and a single index
+into table. The cost stays the same as genes are added to a tree, since the table grows
+rather than the work per horse. The color and pattern tables share the allele cache, so a
+gene used by both (kit) is only hashed once. base_colors and coat_patterns do the lookups
+for many horses at once.
+
+verify checks every entry of the tables against the tree.
+"""
+
+BASE_COLOR_GENES = ('kit', 'extension', 'agouti', 'cream', 'dun', 'champagne', 'dapple', 'flaxen')
+PATTERN_GENES = ('kit', 'sooty', 'rabicano', 'overo', 'splashed', 'leopard_complex', 'pattern1',
+                 'pattern2')
+
+
+def gene_alleles(gene_name):
+    """Return the names of the alleles of a gene, the broken allele first."""
+    return [GENES[gene_name]['broken']] + GENES[gene_name]['alleles']
+
+
+@lru_cache(maxsize=2**16)
+def allele_code(allele, gene_name):
+    """Return the number of an allele (the base pairs of a gene) in gene_alleles."""
+    return gene_alleles(gene_name).index(ge.allele_name(allele, gene_name))
+
+
+def allele_codes(chromosomes, gene_name):
+    """Return the numbers of the alleles of a gene in many chromosomes as an array."""
+    return np.array([allele_code(ge.get_gene(chromosome, gene_name), gene_name)
+                     for chromosome in chromosomes], dtype=np.intp)
+
+
+def compile_table(genes, expressed_allele, tree):
+    """
+    Compile a decision tree into lookup tables.
+    Args:
+        genes (tuple): Names of the genes the tree takes, in the order it takes them.
+        expressed_allele (function): Takes a gene name and a pair of allele names and
+            returns the code the pair expresses.
+        tree (function): Takes the code expressed for each gene and returns a name.
+
+    Returns:
+        dict. genes, expressed (the codes each gene can express), pairs, names and table
+        (see the module docstring).
+    """
+    expressed, pairs = {}, {}
+    for gene in genes:
+        alleles = gene_alleles(gene)
+        codes = [[expressed_allele(gene, (a1, a2)) for a2 in alleles] for a1 in alleles]
+        expressed[gene] = sorted(set(itertools.chain(*codes)))
+        pairs[gene] = np.array([[expressed[gene].index(code) for code in row] for row in codes],
+                               dtype=np.intp)
+
+    names = []
+    table = np.zeros([len(expressed[gene]) for gene in genes], dtype=np.intp)
+    for index in itertools.product(*[range(len(expressed[gene])) for gene in genes]):
+        name = tree(*[expressed[gene][i] for gene, i in zip(genes, index)])
+        if name not in names:
+            names.append(name)
+        table[index] = names.index(name)
+
+    return {'genes': genes, 'expressed': expressed, 'pairs': pairs,
+            'names': names, 'table': table}
+
+
+def lookup(compiled, dna1, dna2):
+    """
+    Look up the names of many horses in a compiled table.
+    Args:
+        compiled (dict): Output of compile_table.
+        dna1 (list): First chromosome of each horse.
+        dna2 (list): Second chromosome of each horse.
+
+    Returns:
+        list. The name of each horse.
+    """
+    index = tuple(compiled['pairs'][gene][allele_codes(dna1, gene), allele_codes(dna2, gene)]
+                  for gene in compiled['genes'])
+    names = compiled['names']
+    return [names[i] for i in compiled['table'][index]]
+
+
+def lookup_one(compiled, chromo1, chromo2):
+    """Return the name of a single horse in a compiled table (see lookup)."""
+    index = tuple(compiled['pairs'][gene][allele_code(ge.get_gene(chromo1, gene), gene),
+                                          allele_code(ge.get_gene(chromo2, gene), gene)]
+                  for gene in compiled['genes'])
+    return compiled['names'][compiled['table'][index]]
+
+
+def verify(compiled, expressed_allele, tree):
+    """Check that every entry of a compiled table matches the tree it was compiled from.
+    Raises ValueError at the first entry that doesn't."""
+    for gene in compiled['genes']:
+        alleles = gene_alleles(gene)
+        for (i, a1), (j, a2) in itertools.product(enumerate(alleles), repeat=2):
+            code = compiled['expressed'][gene][compiled['pairs'][gene][i, j]]
+            if code != expressed_allele(gene, (a1, a2)):
+                raise ValueError(f"The compiled {gene} alleles {a1}/{a2} express {code},"
+                                 f" not {expressed_allele(gene, (a1, a2))}.")
+
+    genes = compiled['genes']
+    for index in itertools.product(*[range(len(compiled['expressed'][gene])) for gene in genes]):
+        codes = [compiled['expressed'][gene][i] for gene, i in zip(genes, index)]
+        name = compiled['names'][compiled['table'][index]]
+        if name != tree(*codes):
+            raise ValueError(f"The compiled table gives {name} for {codes}, not {tree(*codes)}.")
+
+
+BASE_COLORS = compile_table(BASE_COLOR_GENES, up.expressed_allele, up.coat_color)
+PATTERNS = compile_table(PATTERN_GENES, up.expressed_pattern_allele, up.hair_additions)
+
+
+def base_color(chromo1, chromo2):
+    """Return the base color of a horse from its chromosomes."""
+    return lookup_one(BASE_COLORS, chromo1, chromo2)
+
+
+def base_colors(dna1, dna2):
+    """Return the base colors of many horses (see lookup)."""
+    return lookup(BASE_COLORS, dna1, dna2)
+
+
+def coat_pattern(chromo1, chromo2):
+    """Return the coat pattern of a horse from its chromosomes."""
+    return lookup_one(PATTERNS, chromo1, chromo2)
+
+
+def coat_patterns(dna1, dna2):
+    """Return the coat patterns of many horses (see lookup)."""
+    return lookup(PATTERNS, dna1, dna2)
+
+
+def verify_coats():
+    """Check the compiled colors and patterns against their trees (see verify)."""
+    verify(BASE_COLORS, up.expressed_allele, up.coat_color)
+    verify(PATTERNS, up.expressed_pattern_allele, up.hair_additions)
@@ -4,6 +4,8 @@ import math
 import numpy as np
 import game_parameters.constants as c
 import table_operations as to
+import random_context
+import entity_cache
 
 
 with open(os.path.join(c.PARAMS_FOLDER, 'person_names.json'), 'r') as f:
@@ -15,7 +17,7 @@ PERSON_NAMES['female'] += PERSON_NAMES['unisex']
 UNEMPLOYED = 1  # employer_id to indicate unemployed
 
 
-def generate_employee(employee_type='random', points='random', employer=UNEMPLOYED):
+def generate_employee(employee_type='random', points='random', employer=UNEMPLOYED, rng=None):
     """
     Generate a new employee and add them to the database.
     Args:
@@ -24,22 +26,24 @@ def generate_employee(employee_type='random', points='random', employer=UNEMPLOY
         points (int or 'random'): How many skill points to assign per skill. If 'random'
             will give a normally distributed number.
         employer (int): Owner_id of the employer.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
     Returns:
         Int. The employee_id of the new employee.
     """
+    rng = random_context.resolve(rng).employees
 
     if employee_type == 'random':
-        employee_type = np.random.choice(list(c.EMPLOYEES.keys()), 1)[0]
+        employee_type = str(rng.choice(list(c.EMPLOYEES.keys()), 1)[0])
 
     params = {'employee_type': employee_type}
 
     # Provide some skills to the employee
     skills = c.EMPLOYEES[employee_type]['bonuses']
     if points == 'random':
-        points = int(round(np.random.normal(c.MEAN_POINTS, c.STD_POINTS, 1)[0]))
+        points = int(round(rng.normal(c.MEAN_POINTS, c.STD_POINTS, 1)[0]))
     points *= len(skills)
 
-    assignments = np.random.choice(range(len(skills)), points)
+    assignments = rng.choice(range(len(skills)), points)
     for i, s in enumerate(skills.keys()):
         levels = skills[s]['levels']
         params[s] = levels[min(np.sum(assignments == i), len(levels) - 1)]
@@ -48,11 +52,11 @@ def generate_employee(employee_type='random', points='random', employer=UNEMPLOY
     params['salary'] = points*c.SALARY_MULTIPLIER + c.BASE_SALARY
 
     # Generate a name
-    if np.random.choice(['m', 'f'], 1)[0] == 'm':
-        name = np.random.choice(PERSON_NAMES['male'], 1)[0]
+    if rng.choice(['m', 'f'], 1)[0] == 'm':
+        name = rng.choice(PERSON_NAMES['male'], 1)[0]
     else:
-        name = np.random.choice(PERSON_NAMES['female'], 1)[0]
-    name = name + ' ' + np.random.choice(PERSON_NAMES['last'], 1)[0]
+        name = rng.choice(PERSON_NAMES['female'], 1)[0]
+    name = str(name + ' ' + rng.choice(PERSON_NAMES['last'], 1)[0])
     params['name'] = name
 
     # Assign employer
@@ -60,6 +64,7 @@ def generate_employee(employee_type='random', points='random', employer=UNEMPLOY
 
     # Add to the database
     new_id = to.insert_into_table('employees', params)
+    entity_cache.forget('employees', [new_id])
     return new_id
 
 
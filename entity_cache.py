@@ -0,0 +1,133 @@
+import table_operations as to
+
+"""
+Entity cache
+
+Names of horses, owners and employees, looked up from the database at most once. The GUI
+shows the same few names over and over (every message links to the horses in it), so
+rather than a query for every link:
+
+    - names looks up the ids that aren't cached yet together, in one query per table.
+    - select fills a whole list (e.g. the employees for hire) with one query, and caches
+      the names of the rows it returns.
+
+Names never change, but an id can be used again when the tables are recreated for a new
+game, so the functions that add rows (add_horse, add_owner, generate_employee, etc.) call
+forget with the new ids. Everything is forgotten when the active database changes (e.g. a
+save is loaded).
+
+Names are looked up by id in the all_ views, so that links to horses that have been
+archived still show their names (see archive.py).
+"""
+
+# Columns select returns for each table (besides the primary key). None returns every
+# column, since employees are shown with all of their bonuses.
+SUMMARY_COLUMNS = {
+    'horses': ['name', 'gender', 'owner_id', 'birth_date', 'death_date'],
+    'owners': ['name'],
+    'employees': None}
+
+_cache = {'db': None, 'names': {}, 'keys': {}}
+
+
+def _check_db():
+    """Empty the cache if the active database has changed since it was filled."""
+    if _cache['db'] is not to.db:
+        clear()
+        _cache['db'] = to.db
+
+
+def _key_and_name(table):
+    """Return the primary key of the table and its name column (None if it has none)."""
+    if table not in _cache['keys']:
+        columns = to.cursor.execute(f"PRAGMA table_info({table})").fetchall()
+        pk = [col[1] for col in columns if col[5] == 1][0]
+        name = 'name' if any(col[1] == 'name' for col in columns) else None
+        _cache['keys'][table] = pk, name
+    return _cache['keys'][table]
+
+
+def _with_archived(table):
+    """Return the view of a table and its archived copy, or the table if it has none."""
+    return f'all_{table}' if table in to.ARCHIVED_TABLES else table
+
+
+def names(table, ids):
+    """
+    Return the names of several rows of a table, looking up any that aren't cached in a
+    single query.
+    Args:
+        table (str): Name of the table, e.g. 'horses'.
+        ids (list): Primary keys of the rows.
+
+    Returns:
+        dict. id -> name. Rows of tables without a name column are named by their id.
+    """
+    _check_db()
+    cached = _cache['names'].setdefault(table, {})
+    missing = list({int(i) for i in ids if int(i) not in cached})
+    if missing:
+        pk, name = _key_and_name(table)
+        if name is None:
+            cached.update({i: i for i in missing})
+        else:
+            query = f"SELECT {pk}, {name} FROM {_with_archived(table)}" \
+                f" WHERE {pk} IN {to.qmark_list(len(missing))}"
+            cached.update(to.cursor.execute(query, missing).fetchall())
+    return {int(i): cached.get(int(i), int(i)) for i in ids}
+
+
+def name(table, id_):
+    """Return the name of a single row of a table (see names)."""
+    return names(table, [id_])[int(id_)]
+
+
+def select(table, where=None, params=(), archived=False):
+    """
+    Return the SUMMARY_COLUMNS of every row of a table matching a condition, using one
+    query. The names of the rows are cached.
+    Args:
+        table (str): One of the tables in SUMMARY_COLUMNS.
+        where (str or None): SQL condition, e.g. 'owner_id = ?'. If None, returns every row.
+        params (list): Values for the placeholders in where.
+        archived (bool): If True, archived rows are searched too.
+
+    Returns:
+        pd.DataFrame. One row per match, in the order the database returns them.
+    """
+    _check_db()
+    pk, name = _key_and_name(table)
+    columns = SUMMARY_COLUMNS[table]
+    source = _with_archived(table) if archived else table
+    query = f"SELECT {'*' if columns is None else ', '.join([pk] + columns)} FROM {source}"
+    if where is not None:
+        query += f" WHERE {where}"
+    data = to.query_to_dataframe(query, list(params))
+    if name is not None:
+        _cache['names'].setdefault(table, {}).update(zip(data[pk].astype(int), data[name]))
+    return data
+
+
+def forget(table, ids=None):
+    """
+    Forget the cached names of some rows, e.g. because they have just been created.
+    Args:
+        table (str): Name of the table.
+        ids (list or None): Primary keys of the rows. If None, forgets the whole table.
+
+    Returns:
+        None.
+    """
+    _check_db()
+    if ids is None:
+        _cache['names'].pop(table, None)
+    else:
+        cached = _cache['names'].get(table, {})
+        for i in ids:
+            cached.pop(int(i), None)
+
+
+def clear():
+    """Forget everything."""
+    for kind in ('names', 'keys'):
+        _cache[kind] = {}
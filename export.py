@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import argparse
+import table_operations as to
+import game_calendar
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet is optional, CSV always works
+    pyarrow = None
+
+"""
+Export game history
+
+Writes the history of a game (every horse, race and race result, and the properties of
+the horses) to files that can be analysed without the game, e.g. with pandas:
+
+    python export.py saves/20yr_start_game_data.db exported
+    python export.py saves/active_game.db exported --format csv --chunk-size 50000
+
+Each table is written to its own file, as Parquet if pyarrow is installed and as CSV
+otherwise. Tables are read and written CHUNK_SIZE rows at a time, so the memory used
+doesn't grow with the length of the game. Dates are written as dates rather than the
+day numbers they are stored as.
+Archived rows (see archive.py) are exported along with the rest of their table.
+"""
+
+EXPORT_TABLES = ('horses', 'races', 'race_results', 'horse_properties')
+CHUNK_SIZE = 10000  # Rows read and written at a time
+
+# Arrow types of the column types used in create_empty_tables
+ARROW_TYPES = {'integer': 'int64', 'int': 'int64', 'float': 'float64', 'real': 'float64',
+               'text': 'string', 'blob': 'binary'}
+
+
+def export(database, folder, tables=EXPORT_TABLES, file_format='auto', chunk_size=CHUNK_SIZE):
+    """
+    Export tables of a game database to files.
+    Args:
+        database (str): Path of the game database (e.g. a save).
+        folder (str): Folder to write the files to. Created if needed.
+        tables (list): Names of the tables to export.
+        file_format (str): 'parquet', 'csv' or 'auto' (parquet if pyarrow is installed).
+        chunk_size (int): Rows to read and write at a time.
+
+    Returns:
+        dict. table -> path of the file written.
+    """
+    if file_format == 'auto':
+        file_format = 'csv' if pyarrow is None else 'parquet'
+    if file_format == 'parquet' and pyarrow is None:
+        raise ImportError("Exporting to parquet needs pyarrow. Install it or use the csv format.")
+    if file_format not in ('parquet', 'csv'):
+        raise ValueError(f"Unknown format {file_format}. Use parquet or csv.")
+
+    os.makedirs(folder, exist_ok=True)
+    # Read only, so that exporting the active game can't change it
+    connection = sqlite3.connect(f"file:{os.path.abspath(database)}?mode=ro", uri=True)
+    paths = {}
+    try:
+        views = {name for name, in connection.execute("SELECT name FROM sqlite_master WHERE type = 'view'")}
+        for table in tables:
+            paths[table] = os.path.join(folder, f'{table}.{file_format}')
+            source = f'all_{table}' if f'all_{table}' in views else table
+            if file_format == 'parquet':
+                export_parquet(connection, source, paths[table], chunk_size)
+            else:
+                export_csv(connection, source, paths[table], chunk_size)
+    finally:
+        connection.close()
+    return paths
+
+
+def export_csv(connection, table, path, chunk_size=CHUNK_SIZE):
+    """Write a table to a CSV file, chunk_size rows at a time."""
+    with open(path, 'w', newline='') as f:
+        for i, chunk in enumerate(table_chunks(connection, table, chunk_size)):
+            chunk.to_csv(f, index=False, header=i == 0)
+
+
+def export_parquet(connection, table, path, chunk_size=CHUNK_SIZE):
+    """Write a table to a Parquet file, one row group of chunk_size rows at a time."""
+    schema = arrow_schema(connection, table)
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in table_chunks(connection, table, chunk_size):
+            writer.write_table(pyarrow.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+
+def arrow_schema(connection, table):
+    """Return the Arrow schema of a table, from the column types it was created with.
+    The schema has to be known up front, since the first chunk may not have a value in
+    every column (e.g. no horse has died yet). SQLite doesn't hold columns to their
+    declared type, so a column holding any text (e.g. base_color, which is declared float
+    like every property) is written as strings."""
+    fields = []
+    for column, column_type in column_types(connection, table).items():
+        if column in to.DATE_COLUMNS:
+            arrow_type = pyarrow.timestamp('ns')
+        elif has_text(connection, table, column):
+            arrow_type = pyarrow.string()
+        else:
+            arrow_type = pyarrow.type_for_alias(ARROW_TYPES.get(column_type, 'string'))
+        fields.append(pyarrow.field(column, arrow_type))
+    return pyarrow.schema(fields)
+
+
+def column_types(connection, table):
+    """Return a dict of the columns of a table and the (lower case) types they were declared with."""
+    return {column: column_type.lower() for _, column, column_type, *_
+            in connection.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def has_text(connection, table, column):
+    """Return True if any value stored in a column of a table is text."""
+    query = f"SELECT EXISTS (SELECT 1 FROM {table} WHERE typeof({column}) = 'text')"
+    return connection.execute(query).fetchone()[0] == 1
+
+
+def table_chunks(connection, table, chunk_size=CHUNK_SIZE):
+    """
+    Read a table chunk_size rows at a time.
+    Args:
+        connection (sqlite3.Connection): Database to read from.
+        table (str): Name of the table.
+        chunk_size (int): Rows per chunk.
+
+    Yields:
+        pd.DataFrame. The next chunk_size rows (fewer for the last chunk), with the day
+        numbers in the date columns turned into dates. Integer columns stay integers even when some values are missing
+        (e.g. the dam of a horse that wasn't bred).
+    """
+    types = column_types(connection, table)
+    integers = [column for column, column_type in types.items()
+                if ARROW_TYPES.get(column_type) == 'int64' and column not in to.DATE_COLUMNS]
+    dates = [column for column in types if column in to.DATE_COLUMNS]
+    # A save opened read only isn't migrated, so its dates may still be text. These are
+    # turned into day numbers as they are read, the same way migrate_dates would.
+    values = [f"{to.day_number_sql(column)} AS {column}"
+              if column in dates and types[column] != 'integer' else column for column in types]
+    query = f"SELECT {', '.join(values)} FROM {table}"
+    for chunk in to.query_chunks(query, chunk_size=chunk_size, connection=connection):
+        for column in integers:
+            chunk[column] = chunk[column].astype('Int64')
+        for column in dates:
+            chunk[column] = game_calendar.from_day_number(chunk[column])
+        yield chunk
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Export the history of a game for analysis.')
+    parser.add_argument('database', help='Game database to export, e.g. saves/active_game.db.')
+    parser.add_argument('folder', help='Folder to write the files to.')
+    parser.add_argument('--tables', nargs='+', default=list(EXPORT_TABLES), help='Tables to export.')
+    parser.add_argument('--format', default='auto', choices=['auto', 'parquet', 'csv'],
+                        help='File format. auto uses parquet if pyarrow is installed.')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Rows to read and write at a time.')
+    args = parser.parse_args(args)
+
+    paths = export(args.database, args.folder, args.tables, args.format, args.chunk_size)
+    for table, path in paths.items():
+        print(f"{table} written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
-from pandas import to_datetime, datetime
+from datetime import datetime
+from pandas import to_datetime, to_timedelta, Timedelta, Series
 import table_operations as to
 import game_parameters.constants as C
 
+EPOCH = to_datetime(C.DATE_EPOCH)
+
 
 def put_events_on_calendar(year):
     """
@@ -14,13 +17,21 @@ def put_events_on_calendar(year):
         None.
     """
     for event, params in C.EVENTS.items():
-        date = as_sql_date(datetime(year, params['date'][0], params['date'][1]))
+        date = day_number(datetime(year, params['date'][0], params['date'][1]))
         cmd = "INSERT OR REPLACE INTO calendar ('date', 'type', 'name') VALUES (?, ?, ?)"
         to.db.execute(cmd, [date, params['type'], event])
     to.db.commit()
 
 
-def as_sql_date(date):
-    """Return a date in the form 'YYYY-MM-DD'"""
-    date = to_datetime(date)
-    return str(date.date())
\ No newline at end of file
+def day_number(date):
+    """Return the number of days from DATE_EPOCH to a date, which is how dates are stored.
+    Also works on a Series of dates."""
+    return (to_datetime(date) - EPOCH) // Timedelta(days=1)
+
+
+def from_day_number(number):
+    """Return the date of a day number (see day_number). Also works on a Series of numbers,
+    where missing numbers become NaT."""
+    if isinstance(number, Series):
+        number = number.astype('Int64')
+    return EPOCH + to_timedelta(number, unit='D')
@@ -1,7 +1,6 @@
 import os
 import shutil
 import datetime
-import random
 import math
 import pandas as pd
 import numpy as np
@@ -13,6 +12,11 @@ import employee_functions as ef
 import estate
 import phenotype as phe
 import game_calendar
+import random_context
+import query_profiler
+import phase_profiler
+import league_stats
+import archive
 import game_parameters.constants as c
 
 
@@ -21,7 +25,18 @@ class Game:
     owner = 2  # owner_id of the player
     default_start_day = '20000101' #  Start date to use if one hadn't been saved
 
-    def __init__(self, start_day, gui=False, restart=True):
+    def __init__(self, start_day, gui=False, restart=True, seed=None):
+        """
+        Args:
+            start_day (str): Unused. The start day is read from the database.
+            gui (object or False): Anything with the methods of BasicPrinter, which will be
+                told what is happening. If False, a BasicPrinter is used.
+            restart (bool): If True, will clear the database and start from scratch.
+            seed (int or None): Seed for all of the randomness in the game. Games given
+                the same seed and the same commands produce identical databases. If None,
+                a random seed is used.
+        """
+        self.rng = random_context.RandomContext(seed)
         if not gui:
             gui = BasicPrinter(self)
         self.gui = gui
@@ -31,36 +46,83 @@ class Game:
 
         self._read_game_info()
         self.god_mode = False
+        self.profiler = None  # A phase_profiler.PhaseProfiler to time the phases of each day
+        self.progress = None  # Called with (days done, days to do) after each simulated day
+        self._stop = False
+
+        # Care and pay put off while fast-forwarding (see _settle_accruals)
+        self._pending_care_days = 0
+        self._pending_paydays = 0
+        self._affordable_paydays = None
 
-    def run_days(self, number, basic=False):
-        """Run the simulation for a number of days."""
+    def run_days(self, number, basic=False, fast_forward=False):
+        """Run the simulation for a number of days.
+
+        Args:
+            number (int): How many days to simulate.
+            basic (bool): If True, no random races will be run.
+            fast_forward (bool): If True, only the days on which a foal is due, a horse is
+                expected to die or a calendar event happens are stepped through in full.
+                Healing, training and salaries are accrued over the quiet days in between
+                and applied in closed form (see _settle_accruals).
+        """
+        self._stop = False  # A stop asked for after the last run had ended is for nothing
+        schedule, schedule_end = set(), self.day_increment
         for n in range(number):
-            self._deliver_foals()
-            self._kill_horses()
-            self._run_events()
+            if self._stop:
+                break
+            if fast_forward and self.day_increment >= schedule_end:
+                window = min(number - n, c.FAST_FORWARD_WINDOW)
+                schedule = self._scheduled_days(window)
+                schedule_end = self.day_increment + window
+            if not fast_forward or game_calendar.day_number(self.day) in schedule:
+                self._deliver_foals()
+                self._kill_horses()
+                self._run_events()
             if not basic:
-                if random.random() <= c.RACE_PROBABILITY:
+                if self.rng.races.random() <= c.RACE_PROBABILITY:
                     if self.automated:
                         self.race(horse_ids='random')
                     else:
                         self._prepare_for_race()
             if self.day_increment % c.PROPERTY_UPDATE == 0:
-                phe.update_properties(dead_too=False)
+                self._update_properties()
+            if self.day_increment % c.ARCHIVE_INTERVAL == 0:
+                self._archive()
             if self.day_increment % 7 == 0:
-                self._pay_employees()
+                if fast_forward:
+                    self._accrue_payday()
+                else:
+                    self._pay_employees()
             if self.day_increment % 2 == 0:
                 self._ai_sell_extra_horses()
                 self._ai_breed_horses()
-            self._conduct_healing()
-            self._train_horses()
+            if fast_forward:
+                self._pending_care_days += 1
+            else:
+                self._conduct_healing()
+                self._train_horses()
 
             if self.day.date().month == 12 and self.day.date().day == 31:
                 game_calendar.put_events_on_calendar(self.day.date().year+1)
+                schedule_end = 0  # The new events need to be picked up
 
             self.day += datetime.timedelta(1)
             self.day_increment += 1
+            if not fast_forward:
+                self.gui.update_day(self.day)
+                self.gui.update_money()
+            if self.progress is not None:
+                self.progress(n + 1, number)
+
+        if fast_forward:
+            self._settle_accruals()
             self.gui.update_day(self.day)
             self.gui.update_money()
+        if query_profiler.PROFILER.enabled:
+            query_profiler.dump()
+        if self.profiler is not None:
+            self.profiler.flush()
 
     def generate_history(self, number_of_days, number_of_starting_horses):
         """
@@ -72,13 +134,18 @@ class Game:
         Returns:
             None.
         """
-        hf.make_random_horses(number_of_starting_horses, self.day)
+        self._stop = False
+        hf.make_random_horses(number_of_starting_horses, self.day, self.rng)
         self.automated = True
         for n in range(number_of_days):
+            if self._stop:
+                break
             self._deliver_foals()
             self._kill_horses()
             if self.day_increment % c.PROPERTY_UPDATE == 0:
-                phe.update_properties(dead_too=False)
+                self._update_properties()
+            if self.day_increment % c.ARCHIVE_INTERVAL == 0:
+                self._archive()
             if self.day_increment % 30 == 0:
                 self._breed_wild_horses()
                 # The number of races to permit each horse about 1 race per year
@@ -87,10 +154,15 @@ class Game:
 
             self.day += datetime.timedelta(1)
             self.day_increment += 1
+            if self.progress is not None:
+                self.progress(n + 1, number_of_days)
         self.automated = False
 
+        if self.profiler is not None:
+            self.profiler.flush()
+
         for i in range(30):
-            ef.generate_employee()
+            ef.generate_employee(rng=self.rng)
 
         # Set up the player's starting estate
         self.add_owners(5, c.STARTING_MONEY)
@@ -106,6 +178,16 @@ class Game:
         self.gui.update_money()
         self.gui.update_day(self.day)
 
+    @phase_profiler.phase('update_properties')
+    def _update_properties(self):
+        """Recalculate the properties of the living horses."""
+        phe.update_properties(dead_too=False)
+
+    @phase_profiler.phase('archive')
+    def _archive(self):
+        """Move the long dead horses to the archived tables."""
+        archive.archive(self.day)
+
     def _redistribute_horses(self):
         """Redistributes living horses among the players."""
         # Start by returning all horses to the wild
@@ -113,7 +195,7 @@ class Game:
 
         # And then give the human player as many horses as they deserve
         living = np.array(self.living_horses())
-        np.random.shuffle(living)
+        self.rng.game.shuffle(living)
         for i in range(c.HUMAN_STARTING_HORSES):
             hf.trade_horse(living[i], self.owner)
 
@@ -125,6 +207,13 @@ class Game:
                 hf.trade_horse(living[offset], owner_id)
                 offset += 1
 
+    def stop(self):
+        """Make run_days or generate_history stop at the end of the day being simulated.
+        Can be called from another thread. generate_history still sets up the game with the
+        history made so far. Each run starts by clearing the request, so a stop asked for
+        when nothing is running has no effect."""
+        self._stop = True
+
     def load_saved(self, name):
         """Use an existing database for this game."""
         to.load_save(name)
@@ -136,30 +225,42 @@ class Game:
     def save_game(self, name):
         """Save the database for this game."""
         # The game state information has to be saved
-        d = pd.DataFrame({'date': self.day, 'date_increment': self.day_increment}, index=[0])
+        d = pd.DataFrame({'date': game_calendar.day_number(self.day),
+                          'date_increment': self.day_increment}, index=[0])
         d.to_sql('game_info', to.db, if_exists='replace', index=False)
 
         # Save the database
         to.save_game(name)
 
+    @phase_profiler.phase('deliver_foals')
     def _deliver_foals(self):
-        command = f"SELECT horse_id, name, owner_id from horses where due_date = '{str(self.day)}'"
-        to_deliver = to.query_to_dataframe(command)
+        command = "SELECT horse_id, name, owner_id from horses where due_date = ?"
+        to_deliver = to.query_to_dataframe(command, [game_calendar.day_number(self.day)])
+        if len(to_deliver) > 0:
+            self._settle_accruals()
+            if self.profiler is not None:
+                self.profiler.count('born', len(to_deliver), self.day)
         for _, horse in to_deliver.iterrows():
             if horse['owner_id'] == self.owner:
-                foal_info = hf.give_birth(horse['horse_id'], self.day,store_horse=False)
+                foal_info = hf.give_birth(horse['horse_id'], self.day, store_horse=False,
+                                          rng=self.rng)
                 name = self.gui.ask_to_name_foal(horse['name'], foal_info['gender'])
                 foal_info['name'] = name
                 foal_id = hf.add_horse(foal_info)
             else:
-                foal_id = hf.give_birth(horse['horse_id'], self.day, name=None)
+                foal_id = hf.give_birth(horse['horse_id'], self.day, name=None, rng=self.rng)
             self.gui.display_message(
                 f"[horses:{horse['horse_id']}] has given birth to a foal named [horses:{foal_id}].")
 
+    @phase_profiler.phase('kill_horses')
     def _kill_horses(self):
         """Kill any horses who are due to die this day."""
-        command = f"SELECT horse_id, name from horses where expected_death = '{str(self.day)}'"
-        to_kill = pd.read_sql_query(command, to.db)
+        command = "SELECT horse_id, name from horses where expected_death = ?"
+        to_kill = pd.read_sql_query(command, to.db, params=[game_calendar.day_number(self.day)])
+        if len(to_kill) > 0:
+            self._settle_accruals()
+            if self.profiler is not None:
+                self.profiler.count('died', len(to_kill), self.day)
         for _, horse in to_kill.iterrows():
             self.gui.display_message(f"[horses:{horse['horse_id']}] has died. F.")
             hf.kill_horse(horse['horse_id'], self.day)
@@ -184,25 +285,26 @@ class Game:
         Returns:
             None.
         """
+        rng = self.rng
         # Determine the prizes for the race
         if purse == 'random':
-            total_purse = int(np.random.power(1)*1000)
-            purse_1 = int(total_purse * np.random.uniform(0.5, 0.9))
-            purse_2 = int((total_purse - purse_1) * np.random.uniform(0.5, 0.9))
+            total_purse = int(rng.races.power(1)*1000)
+            purse_1 = int(total_purse * rng.races.uniform(0.5, 0.9))
+            purse_2 = int((total_purse - purse_1) * rng.races.uniform(0.5, 0.9))
             purse_3 = total_purse - purse_1 - purse_2
             purse = (purse_1, purse_2, purse_3)
 
         # Determine a name for the race
         if name == 'random':
-            start = random.choice(['Santa Anita', 'Rhineland', 'American', 'Royal',
-                                   'Sussex', 'Alameda', 'Atlanta', 'Champions'])
-            end = random.choice(['Stakes', 'Invitational', 'Derby', 'Cup', 'Classic',
-                                 'Handicap', 'International', 'Sprint', 'Memorial'])
+            start = str(rng.races.choice(['Santa Anita', 'Rhineland', 'American', 'Royal',
+                                   'Sussex', 'Alameda', 'Atlanta', 'Champions']))
+            end = str(rng.races.choice(['Stakes', 'Invitational', 'Derby', 'Cup', 'Classic',
+                                 'Handicap', 'International', 'Sprint', 'Memorial']))
             name = f'{start} {end}'
 
         # Determine the length
         if length == 'random':
-            length = random.choice([1000, 1500, 2000, 2500])
+            length = int(rng.races.choice([1000, 1500, 2000, 2500]))
 
         self.current_race = {'purse': purse, 'length': length, 'name': name,
                              'horses_for_player': horses_for_player, 'racers': racers,
@@ -213,15 +315,15 @@ class Game:
 
     def run_race(self, player_horses=()):
         """Run a race with the provided horses from the player."""
+        self._settle_accruals()  # Which horses are fit to race depends on their damage
         horses = list(player_horses)
         horses_needed = self.current_race['racers'] - len(player_horses)
-        owner_picks = np.random.choice(self.ai_owners, horses_needed)
-        for o in self.ai_owners:
-            number = np.sum(owner_picks == o)
-            horses += of.pick_race_horses(o, number)
+        owner_picks = self.rng.races.choice(self.ai_owners, horses_needed)
+        horses += of.pick_race_entrants({o: np.sum(owner_picks == o) for o in self.ai_owners})
         self.race(horse_ids=horses, track_length=self.current_race['length'],
                   winnings=self.current_race['purse'], speed_bonus=self.current_race['speed_bonus'])
 
+    @phase_profiler.phase('race')
     def race(self, horse_ids='random', track_length=1000., noisey_speeds=True,
              winnings=(100, 50, 20), allow_injuries=True, speed_bonus=0):
         """Race the specified horses to see who is the fastest.
@@ -240,9 +342,13 @@ class Game:
                 input.
             List. The numbers of the top 3 finishers.
         """
+        self._settle_accruals()
+        # Rebuild the league statistics of an old save before this race is added, so that
+        # record_race doesn't count it a second time
+        league_stats.stats()
         if horse_ids == 'random':
             horses = hf.raceable_horses(owner_id=None)
-            horse_ids = np.random.choice(horses, 8, replace=False)
+            horse_ids = self.rng.races.choice(horses, 8, replace=False)
         horse_ids = np.array(horse_ids)
         if len(horse_ids) < len(winnings):
             self.gui.display_message("The race was canceled because there were too few horses.")
@@ -264,7 +370,7 @@ class Game:
         speeds = to.query_to_dataframe(qry)
         speeds.loc[speeds['owner_id'] != self.owner, 'speed'] += speed_bonus
         if noisey_speeds:
-            speeds['speed'] += np.random.normal(0, 1, len(speeds))
+            speeds['speed'] += self.rng.races.normal(0, 1, len(speeds))
 
         # See if any injuries occur
         if allow_injuries:
@@ -295,6 +401,10 @@ class Game:
         del speeds['owner_id']
         del speeds['speed']
         to.insert_dataframe_into_table('race_results', speeds)
+        league_stats.record_race(self.day, speeds['horse_id'].values)
+        if self.profiler is not None:
+            self.profiler.count('races', 1, self.day)
+            self.profiler.count('raced', len(speeds), self.day)
 
         # Format a message for the gui
         h1 = speeds.iloc[0]
@@ -314,6 +424,7 @@ class Game:
         self.gui.display_message(msg)
         self.gui.update_money()
 
+    @phase_profiler.phase('breed_wild_horses')
     def _breed_wild_horses(self):
         """Breed wild horses randomly to achieve a growth rate."""
         pop_growth = 0.008  # monthly population growth. Corresponds to about 10% annual
@@ -321,12 +432,12 @@ class Game:
         options = self.breedable_horses()
         if pregnancies == 0 or len(options[options['gender'] == 'F']) == 0:
             return
-        fems = np.random.choice(
+        fems = self.rng.game.choice(
             options.loc[options['gender'] == 'F', 'horse_id'].values, pregnancies, replace=False)
         for fem in fems:
-            male = np.random.choice(options.loc[options['gender'] == 'M', 'horse_id'].values)
+            male = self.rng.game.choice(options.loc[options['gender'] == 'M', 'horse_id'].values)
             try:
-                hf.horse_sex(fem, male, self.day)
+                hf.horse_sex(fem, male, self.day, self.rng)
             except (ValueError, hf.PregnancyIssue):
                 pass
 
@@ -346,43 +457,37 @@ class Game:
                 will return horses for all owners.
 
         """
-        youngest = str(self.day - datetime.timedelta(c.SEXUAL_MATURITY))
-        if owner is None:
-            command = f"SELECT * FROM horses where" \
-                f" death_date is NULL" \
-                f" and due_date is NULL" \
-                f" and birth_date <= '{youngest}'"
-        else:
-            command = f"SELECT * FROM horses where" \
-                f" owner_id = {owner}" \
-                f" and death_date is NULL" \
-                f" and due_date is NULL" \
-                f" and birth_date <= '{youngest}'"
-        horses = to.query_to_dataframe(command)
-        horses['age'] = horses['birth_date'].apply(self.display_age)
+        condition, params = self.breedable_condition(owner)
+        horses = to.query_to_dataframe(f"SELECT * FROM horses where {condition}", params)
+        horses['age'] = hf.display_ages(hf.horse_ages(horses['birth_date'], self.day))
         return horses[['name', 'horse_id', 'gender', 'age']]
 
+    def breedable_condition(self, owner=None):
+        """Return the condition (for a query on the horses table) which picks out the horses
+        that can be made to breed, and its parameters (see breedable_horses)."""
+        youngest = game_calendar.day_number(self.day) - c.SEXUAL_MATURITY
+        if owner is None:
+            return "death_date is NULL and due_date is NULL and birth_date <= ?", [youngest]
+        return ("owner_id = ? and death_date is NULL and due_date is NULL and birth_date <= ?",
+                [int(owner), youngest])
+
     def display_age(self, birthday):
-        """Converts a birthday into an approximate age."""
-        age = (self.day - birthday).days
-        years = age//365
-        months = (age - years*365)//30
-        if years == 0:
-            return f"{months}m"
-        return f"{years}y {months}m"
+        """Converts a birthday (day number) into an approximate age."""
+        return str(hf.display_ages(hf.horse_ages([birthday], self.day))[0])
 
     def horse_info(self, horse_id):
         """Return formatted information of the desired horse."""
-        data = to.get_rows('horses', [horse_id]).iloc[0]
-        age = (self.day - data['birth_date']).days
+        data = to.query_to_dataframe("SELECT * FROM all_horses WHERE horse_id = ?", [horse_id]).iloc[0]
+        age = game_calendar.day_number(self.day) - data['birth_date']
         title = hf.horse_title(data['gender'], age)
         props = to.query_to_dataframe(
-            f"SELECT * FROM horse_properties WHERE horse_id = {horse_id}").iloc[0]
+            f"SELECT * FROM all_horse_properties WHERE horse_id = {horse_id}").iloc[0]
         if pd.isna(data['death_date']):
             verb = 'is'
         else:
             verb = 'was'
-        msg = f"[horses:{data['horse_id']}] {verb} a {props['base_color']}" \
+        coat = f"{props['base_color']} {props['coat_pattern']}".strip()
+        msg = f"[horses:{data['horse_id']}] {verb} a {coat}" \
             f" {title} of age {self.display_age(data['birth_date'])}."
 
         # Add parent information
@@ -484,8 +589,9 @@ class Game:
             elif i == 1:
                 of.add_owner(0, 'Wild')
             else:
-                of.add_owner(starting_cash)
+                of.add_owner(starting_cash, rng=self.rng)
 
+    @phase_profiler.phase('pay_employees')
     def _pay_employees(self):
         """Attempt to pay employees their salary. If unable, they will quit."""
 
@@ -499,29 +605,112 @@ class Game:
             to.cursor.execute(command, [ef.UNEMPLOYED, self.owner])
             of.remove_money(self.owner, 'all')
 
-    def _conduct_healing(self):
+    @phase_profiler.phase('conduct_healing')
+    def _conduct_healing(self, days=1):
         """
         Heal horses and apply any bonuses resulting from employees.
+        Args:
+            days (int): Number of days of healing to apply.
         Returns:
             None.
         """
         for owner in of.owner_list():
             if owner == self.owner:
-                hf.heal_horses(owner_id=owner, heal_rate=ef.employee_bonus(owner, 'heal_rate')+c.HEAL_RATE)
+                hf.heal_horses(owner_id=owner, heal_rate=ef.employee_bonus(owner, 'heal_rate')+c.HEAL_RATE,
+                               days=days)
             else:
-                hf.heal_horses(owner_id=owner)
+                hf.heal_horses(owner_id=owner, days=days)
 
-    def _train_horses(self):
+    @phase_profiler.phase('train_horses')
+    def _train_horses(self, days=1):
         """
         Add (or subtract) from all the horses' training.
+        Args:
+            days (int): Number of days of training to apply.
         Returns:
             None.
         """
         for owner in of.owner_list():
             if owner == self.owner:
-                hf.train_horses(owner_id=owner, training_amount=ef.employee_bonus(owner, 'training_rate')-c.TRAINING_DECAY)
+                hf.train_horses(owner_id=owner, training_amount=ef.employee_bonus(owner, 'training_rate')-c.TRAINING_DECAY,
+                                days=days)
+            else:
+                hf.train_horses(owner_id=owner, training_amount=c.AI_TRAINING-c.TRAINING_DECAY,
+                                days=days)
+
+    def _accrue_payday(self):
+        """Put off paying the employees until the accruals are settled. If the player might
+        not be able to afford all of the paydays owed, settle up and pay as normal so that
+        the employees quit on the same day as they otherwise would."""
+        if self._affordable_paydays is None:
+            salary = ef.total_salary(self.owner)
+            if salary == 0:
+                self._affordable_paydays = math.inf
             else:
-                hf.train_horses(owner_id=owner, training_amount=c.AI_TRAINING-c.TRAINING_DECAY)
+                self._affordable_paydays = of.money(self.owner) // salary
+        if self._pending_paydays < self._affordable_paydays:
+            self._pending_paydays += 1
+        else:
+            self._settle_accruals()
+            self._pay_employees()
+
+    @phase_profiler.phase('settle_accruals')
+    def _settle_accruals(self):
+        """
+        Apply any healing, training and pay which have been put off while fast-forwarding.
+
+        Healing and training are clamped linear functions of time: n days of healing at a
+        rate r is MAX(0, damage - n*r) and n days of training is MIN(MAX(0, t + n*a), max).
+        These only hold while the rates and the horses they apply to stay the same, so this
+        must be called before anything that changes who owns which horse, how many horses
+        an owner has, how much damage they carry, or how much money the player has.
+        Settled this way, damage and training match a day by day simulation to within
+        floating point rounding (~1e-9).
+
+        Returns:
+            None.
+        """
+        if self._pending_care_days > 0:
+            self._conduct_healing(days=self._pending_care_days)
+            self._train_horses(days=self._pending_care_days)
+            self._pending_care_days = 0
+        if self._pending_paydays > 0:
+            salary = ef.total_salary(self.owner)
+            of.remove_money(self.owner, salary * self._pending_paydays)
+            self.gui.display_message(f"Payday! Your happy employees take home"
+                                     f" ${salary * self._pending_paydays}"
+                                     f" for the last {self._pending_paydays} week(s).")
+            self._pending_paydays = 0
+        # Money may have changed, so affordability needs to be rechecked
+        self._affordable_paydays = None
+
+    def _scheduled_days(self, number):
+        """
+        Return the days within the next number of days on which a foal is due, a horse is
+        expected to die or a calendar event happens.
+
+        Foals conceived after this is called are not included, so number should be no
+        longer than FAST_FORWARD_WINDOW, which is far shorter than any plausible gestation.
+        Args:
+            number (int): How many days ahead to look.
+
+        Returns:
+            Set. The days, as day numbers.
+        """
+        first = game_calendar.day_number(self.day)
+        last = first + number
+        qry = """
+            SELECT due_date FROM horses
+                WHERE due_date >= ? AND due_date < ?
+            UNION
+            SELECT expected_death FROM horses
+                WHERE expected_death >= ? AND expected_death < ?
+            UNION
+            SELECT date FROM calendar
+                WHERE date >= ? AND date < ?
+        """
+        days = to.cursor.execute(qry, [first, last] * 3).fetchall()
+        return set(x[0] for x in days)
 
     def _injure_horse(self, horse_id, event):
         """
@@ -533,7 +722,7 @@ class Game:
             Bool. True, if the horse is injured at all. False, otherwise.
         """
         owner = hf.owner_of(horse_id)
-        injuries = hf.check_for_injuries(horse_id, event)
+        injuries = hf.check_for_injuries(horse_id, event, self.rng)
         injury_reduction = ef.employee_bonus(owner, 'major_injury_reduction')
         for injury in injuries:
             inj_info = c.INJURIES[event][injury]
@@ -541,7 +730,7 @@ class Game:
             reduced = False
             try:
                 new_inj = inj_info['reduces_to']
-                if random.random() <= injury_reduction:
+                if self.rng.races.random() <= injury_reduction:
                     reduced = True
                     new_inj_info = c.INJURIES[event][new_inj]
                     self.gui.display_message(
@@ -574,51 +763,74 @@ class Game:
         self.gui.update_money()
         self.god_mode = True
 
+    @phase_profiler.phase('ai_sell_extra_horses')
     def _ai_sell_extra_horses(self):
         """Have the AI sell horses above a certain threshold.
 
         The current heuristic is to sell the horses with the lowest speed.
         """
-        for owner_id in self.ai_owners:
-            q = """
-            SELECT horse_properties.horse_id, speed FROM horse_properties \
-                INNER JOIN horses ON horse_properties.horse_id = horses.horse_id
-                WHERE horses.owner_id = ? AND horses.death_date is NULL
-                ORDER BY speed DESC
-            """
-            to_sell = to.query_to_dataframe(q, [owner_id]).iloc[20:]
-            of.add_money(owner_id, len(to_sell) * c.MEAT_PRICE)
-            for i, horse in to_sell.iterrows():
-                hf.trade_horse(horse['horse_id'], self.wild)
+        owners = self.ai_owners
+        q = f"""
+        SELECT horse_id, owner_id FROM (
+            SELECT
+                horse_properties.horse_id,
+                horses.owner_id,
+                ROW_NUMBER() OVER (
+                    PARTITION BY horses.owner_id
+                    ORDER BY speed DESC, horse_properties.horse_id) AS herd_rank
+            FROM horse_properties
+            INNER JOIN horses ON horse_properties.horse_id = horses.horse_id
+            WHERE horses.owner_id IN {to.qmark_list(len(owners))} AND horses.death_date is NULL)
+        WHERE herd_rank > ?
+        """
+        to_sell = to.cursor.execute(q, owners + [c.AI_HERD_SIZE]).fetchall()
+        if len(to_sell) == 0:
+            return
+        self._settle_accruals()
+        horse_ids, sellers = zip(*to_sell)
+        sold = pd.Series(sellers).value_counts()
+        of.add_money_to_owners({o: int(n) * c.MEAT_PRICE for o, n in sold.items()})
+        hf.trade_horses(horse_ids, self.wild)
 
+    @phase_profiler.phase('ai_breed_horses')
     def _ai_breed_horses(self):
         """Have the AI breed good horses together.
 
         The current heuristic is to breed all males with the fastest stallions. The
         probability of a stallion breeding is given by a boltzmann distribution.
         """
-        youngest = str(self.day - datetime.timedelta(c.SEXUAL_MATURITY))
-        for owner_id in self.ai_owners:
-            q = """
-            SELECT horse_properties.horse_id, speed, gender FROM horse_properties \
-                INNER JOIN horses ON horse_properties.horse_id = horses.horse_id
-                    WHERE horses.owner_id = ?
-                    AND horses.death_date is NULL
-                    AND horses.due_date is NULL
-                    AND horses.birth_date < ?
-                ORDER BY speed DESC
-            """
-            to_breed = to.query_to_dataframe(q, [owner_id, youngest])
-            ladies = to_breed[to_breed['gender'] == 'F']
-            men = to_breed[to_breed['gender'] == 'M'].copy()
-            if len(ladies) == 0 or len(men) == 0:
-                continue
-            men['speed'] -= men['speed'].min()
-            men['prob'] = men['speed'].apply(lambda x: math.e**(x/.2))
-            men['prob'] /= men['prob'].sum()
-            bred_men = np.random.choice(men['horse_id'].values, size=len(ladies), p=men['prob'])
-            for i, lady_id in enumerate(ladies['horse_id'].values):
-                hf.horse_sex(lady_id, bred_men[i], self.day)
+        owners = self.ai_owners
+        youngest = game_calendar.day_number(self.day) - c.SEXUAL_MATURITY
+        q = f"""
+        SELECT horse_properties.horse_id, speed, gender, owner_id FROM horse_properties
+            INNER JOIN horses ON horse_properties.horse_id = horses.horse_id
+                WHERE horses.owner_id IN {to.qmark_list(len(owners))}
+                AND horses.death_date is NULL
+                AND horses.due_date is NULL
+                AND horses.birth_date < ?
+            ORDER BY owner_id, speed DESC
+        """
+        to_breed = to.query_to_dataframe(q, owners + [youngest])
+        # Only owners with both mares and stallions can breed
+        genders = to_breed.groupby('owner_id')['gender'].nunique()
+        to_breed = to_breed[to_breed['owner_id'].isin(genders.index[genders == 2])]
+        if len(to_breed) == 0:
+            return
+        ladies = to_breed[to_breed['gender'] == 'F']
+        men = to_breed[to_breed['gender'] == 'M']
+
+        # Each owner picks a stallion for each of their mares from a Boltzmann distribution
+        # over the speeds, shifted by the fastest so that the exponent can never overflow
+        stallions_of = dict(tuple(men.groupby('owner_id')))
+        dams, sires = [], []
+        for owner_id, mares in ladies.groupby('owner_id'):
+            stallions = stallions_of[owner_id]
+            weights = np.exp((stallions['speed'] - stallions['speed'].max()).values
+                             / c.AI_BREEDING_TEMPERATURE)
+            dams.append(mares['horse_id'].values)
+            sires.append(self.rng.owners.choice(stallions['horse_id'].values,
+                                                size=len(mares), p=weights/weights.sum()))
+        hf.breed_horses(np.concatenate(dams), np.concatenate(sires), self.day, self.rng)
 
     @property
     def ai_owners(self):
@@ -632,14 +844,15 @@ class Game:
             self.day = pd.to_datetime(self.default_start_day)
             self.day_increment = 0
         else:
-            self.day = pd.to_datetime(info['date'])
+            self.day = game_calendar.from_day_number(info['date'])
             self.day_increment = info['date_increment']
 
+    @phase_profiler.phase('run_events')
     def _run_events(self):
         """Run any events which are due to happen on the current day."""
 
         qry = f"SELECT * FROM calendar WHERE date=?"
-        events = to.query_to_dataframe(qry, params=[game_calendar.as_sql_date(self.day)])
+        events = to.query_to_dataframe(qry, params=[game_calendar.day_number(self.day)])
         for i, event in events.iterrows():
             info = c.EVENTS[event['name']]
             if event['type'] == 'race':
@@ -655,7 +868,7 @@ class Race:
     tables with the results."""
 
     def __init__(self, length='random', name='random', track='dirt', horses_for_player=1,
-                 racers=10, purse='random', speed_bonus=0.0):
+                 racers=10, purse='random', speed_bonus=0.0, rng=None):
         """
         Args:
             length (float, 'random'): Length of the race (in meters). If 'random, will use
@@ -668,26 +881,28 @@ class Race:
                 will generate a random purse.
             speed_bonus (float): How much of a speed boost to give to non-player horses
                 (in m/s). A negative value will slow those horses down.
+            rng (RandomContext or None): Source of randomness. If None, uses the default.
         """
+        rng = random_context.resolve(rng)
         # Determine the prizes for the race
         if purse == 'random':
-            total_purse = int(np.random.power(1)*1000)
-            purse_1 = int(total_purse * np.random.uniform(0.5, 0.9))
-            purse_2 = int((total_purse - purse_1) * np.random.uniform(0.5, 0.9))
+            total_purse = int(rng.races.power(1)*1000)
+            purse_1 = int(total_purse * rng.races.uniform(0.5, 0.9))
+            purse_2 = int((total_purse - purse_1) * rng.races.uniform(0.5, 0.9))
             purse_3 = total_purse - purse_1 - purse_2
             purse = (purse_1, purse_2, purse_3)
 
         # Determine a name for the race
         if name == 'random':
-            start = random.choice(['Santa Anita', 'Rheinland', 'American', 'Royal',
-                                   'Sussex', 'Alameda', 'Atlanta', 'Champions'])
-            end = random.choice(['Stakes', 'Invitational', 'Derby', 'Cup', 'Classic',
-                                 'Handicap', 'International', 'Sprint', 'Memorial'])
+            start = str(rng.races.choice(['Santa Anita', 'Rheinland', 'American', 'Royal',
+                                   'Sussex', 'Alameda', 'Atlanta', 'Champions']))
+            end = str(rng.races.choice(['Stakes', 'Invitational', 'Derby', 'Cup', 'Classic',
+                                 'Handicap', 'International', 'Sprint', 'Memorial']))
             name = f'{start} {end}'
 
         # Determine the length
         if length == 'random':
-            length = random.choice([1000, 1500, 2000, 2500])
+            length = int(rng.races.choice([1000, 1500, 2000, 2500]))
 
         self.length = length
         self.purse = purse
@@ -720,5 +935,32 @@ class BasicPrinter:
             return []
 
 
+class HeadlessPrinter:
+    """Stands in for the gui when nobody is watching (e.g. batch runs). The player doesn't
+    enter any horses when invited to a race, but the race is still run with the AI owners'
+    horses. Foals keep their random names and messages are only counted."""
+
+    def __init__(self, game):
+        self.game = game
+        self.messages = 0
+
+    def display_message(self, msg):
+        self.messages += 1
+
+    def update_day(self, date):
+        pass
+
+    def update_money(self):
+        pass
+
+    def ask_to_join_race(self):
+        self.game.run_race()
+
+    def ask_to_name_foal(self, mother, foal_gender):
+        if foal_gender == 'M':
+            return str(self.game.rng.names.choice(hf.MALE_NAMES))
+        return str(self.game.rng.names.choice(hf.FEMALE_NAMES))
+
+
 #g = Game('20150101')
 #g.simulate_horse_population(100)
\ No newline at end of file
@@ -60,9 +60,23 @@ LIFE_MEAN = 9490  # Mean lifespan (in days)
 LIFE_STD = 730  # Lifespan standard deviation
 PROPERTY_UPDATE = 30  # How frequently to update a horse's anatomical information
 
+# Dates
+DATE_EPOCH = '2000-01-01'  # Dates are stored as the number of days since this day
+
+# Simulation
+FAST_FORWARD_WINDOW = 250  # Days to look ahead for births/deaths/events when fast-forwarding.
+                           # Must be shorter than any plausible gestation.
+ARCHIVE_INTERVAL = 365  # Days between moving long dead horses to the archived tables
+ARCHIVE_RACE_RESULTS = True  # If True, the race results of archived horses are archived too
+
 # Economic Values
 MEAT_PRICE = 200  # How much a horse can be sold to the abattoir for
 
+# AI Owners
+AI_HERD_SIZE = 20  # AI owners send their slowest horses beyond this many to the abattoir
+AI_BREEDING_TEMPERATURE = .2  # Speed (m/s) difference that makes a stallion e times more likely
+                              # to be picked by an AI owner for breeding
+
 # Training Info
 TRAINING_DECAY = 1  # Amount that a horse's training will decrease by each day
 MAX_TRAINING = 100  # Maximum amount of training that a horse can have
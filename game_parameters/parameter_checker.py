@@ -1,5 +1,6 @@
 import os
 import game_parameters.constants as c
+import coat_table
 
 """
 The goal is to check parameters for correctness. Certain values must be within particular
@@ -47,4 +48,5 @@ def check_genes():
 
 
 check_genes()
+coat_table.verify_coats()
 print('Parameters pass checks.')
\ No newline at end of file
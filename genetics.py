@@ -1,5 +1,7 @@
 import hashlib
+from functools import lru_cache
 import numpy as np
+import random_context
 from game_parameters.constants import *
 
 
@@ -48,8 +50,17 @@ def activity_level(chromosome, gene_name):
         Float. Raw activity level for the allele ranging from 0 to 1.
         Bool. True if the gene is well formed.
     """
+    return allele_activity(get_gene(chromosome, gene_name), gene_name)
+
+
+@lru_cache(maxsize=2**16)
+def allele_activity(allele, gene_name):
+    """Return the activity level of an allele of a gene (see activity_level).
+
+    The result only depends on the allele and gene, and a bred population shares most of its
+    alleles, so the results are cached rather than rehashed for every horse.
+    """
     cutoff = GENES[gene_name].get('cutoff', DEFAULT_WELL_FORMED_CUTOFF)
-    allele = get_gene(chromosome, gene_name)
     if cutoff > 1 or cutoff < 0:
         raise ValueError("Gene well-formed cutoff must be between 0 and 1, inclusive.")
     hashed = apply_hash(allele + str(gene_name))
@@ -67,37 +78,40 @@ def activity_level(chromosome, gene_name):
         return 0., activity, well_formed
 
 
-def mutate(chromosome, mutation_rate):
+def mutate(chromosome, mutation_rate, rng=None):
     """Introduce substitution errors into a chromosome at the provided rate.
 
     Args:
         chromosome (str): Genetic material to mutate.
         mutation_rate (float): Probability of mutating each character from 0 to 1 inclusive.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
 
     Return:
         Str. A new chromosome with mutations introduced.
     """
     if mutation_rate > 1 or mutation_rate < 0:
         raise ValueError("The chromosome mutation rate must be between 0 and 1, inclusive.")
+    rng = random_context.resolve(rng)
     chromosome = np.array(list(chromosome)).astype(int)
-    mutate = np.random.choice([0, 1], size=len(chromosome), p=[1-mutation_rate, mutation_rate])
-    mutations = np.random.randint(0, 10, len(chromosome))
+    mutate = rng.genetics.choice([0, 1], size=len(chromosome), p=[1-mutation_rate, mutation_rate])
+    mutations = rng.genetics.integers(0, 10, len(chromosome))
     chromosome[mutate == 1] = mutations[mutate == 1]
     return ''.join(chromosome.astype(str))
 
 
-def mix_chromosomes(chromo1, chromo2):
+def mix_chromosomes(chromo1, chromo2, rng=None):
     """Mix the two chromosomes of an individual into a single new chromosome.
 
     Args:
         chromo1 (str): First chromosome.
         chromo2 (str): Second chromosome.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
 
     Return:
         Str. A chromosome string which a mixture of the alleles in the two originals.
     """
     output = ''
-    choices = np.random.randint(0, 2, CHROMOSOME_LENGTH)
+    choices = random_context.resolve(rng).genetics.integers(0, 2, CHROMOSOME_LENGTH)
     for i in range(CHROMOSOME_LENGTH):
         if choices[i] == 0:
             output += chromo1[i * GENE_LENGTH:(i + 1) * GENE_LENGTH]
@@ -115,9 +129,28 @@ def get_gene(chromosome, gene_name):
         raise ValueError(f"The gene, {gene_name}, does not exist.")
 
 
-def random_chromosome():
-    """Return a random chromosome."""
-    return ''.join(str(elem) for elem in np.random.randint(0, 10, GENE_LENGTH*CHROMOSOME_LENGTH))
+def random_chromosome(rng=None):
+    """Return a random chromosome.
+
+    Args:
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
+    """
+    rng = random_context.resolve(rng)
+    return ''.join(str(elem) for elem in rng.genetics.integers(0, 10, GENE_LENGTH*CHROMOSOME_LENGTH))
+
+
+def random_chromosomes(number, rng=None):
+    """Return a list of random chromosomes.
+
+    Args:
+        number (int): How many chromosomes to make.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
+    """
+    rng = random_context.resolve(rng)
+    length = GENE_LENGTH*CHROMOSOME_LENGTH
+    digits = rng.genetics.integers(0, 10, (number, length), dtype=np.uint8) + ord('0')
+    # Each row of ASCII digits is read as one byte string
+    return digits.view(f'S{length}').ravel().astype(str).tolist()
 
 
 def discrete_allele(chromosome, gene_name):
@@ -130,6 +163,12 @@ def discrete_allele(chromosome, gene_name):
     Return:
         str. Name of the allele.
     """
+    return allele_name(get_gene(chromosome, gene_name), gene_name)
+
+
+@lru_cache(maxsize=2**16)
+def allele_name(allele, gene_name):
+    """Return the name of an allele of a gene (see discrete_allele). Cached like allele_activity."""
     gene = GENES[gene_name]
 
     try:
@@ -140,7 +179,6 @@ def discrete_allele(chromosome, gene_name):
                          f' activity_level.')
 
     cutoff = gene.get('cutoff', DEFAULT_WELL_FORMED_CUTOFF)
-    allele = get_gene(chromosome, gene_name)
     if cutoff > 1 or cutoff < 0:
         raise ValueError("Gene well-formed cutoff must be between 0 and 1, inclusive.")
     hashed = apply_hash(allele + str(gene_name))
@@ -152,4 +190,3 @@ def discrete_allele(chromosome, gene_name):
     activity = (hashed % 100 + 1.)/100
 
     return gene['alleles'][np.sum(activity >= np.array(gene.get('ranges', [])))]
-
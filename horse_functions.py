@@ -1,12 +1,15 @@
 import os
-import datetime
 import json
-import random
 import numpy as np
 import pandas as pd
 import table_operations
 import genetics
 import phenotype
+import coat_table
+import random_context
+import league_stats
+import entity_cache
+import game_calendar
 from game_parameters.constants import *
 
 try:
@@ -19,50 +22,106 @@ except FileNotFoundError:
 MALE_NAMES = HORSE_NAMES['male'] + HORSE_NAMES['unisex']
 FEMALE_NAMES = HORSE_NAMES['female'] + HORSE_NAMES['unisex']
 
+# Ages (in days) at which a horse stops being a weanling, a yearling and a colt or filly
+AGE_BUCKETS = [365, 365*2, 365*4]
+# Title of a horse of each gender in each age bucket
+TITLES = {'M': np.array(['weanling colt', 'yearling colt', 'colt', 'stallion']),
+          'F': np.array(['weanling filly', 'yearling filly', 'filly', 'mare'])}
+
+
+def horse_ages(birth_days, date):
+    """Return the ages (in days) on a date of horses born on the given day numbers."""
+    return game_calendar.day_number(date) - np.asarray(birth_days)
+
+
+def age_buckets(ages):
+    """Return the number of the bucket of AGE_BUCKETS that each age falls into (0 for a
+    weanling up to 3 for a fully grown horse)."""
+    return np.digitize(ages, AGE_BUCKETS)
+
+
+def horse_titles(genders, ages):
+    """Return the title (e.g. 'yearling filly') of each of several horses, from their
+    genders and ages (in days)."""
+    buckets = age_buckets(ages)
+    return np.where(np.asarray(genders) == 'M', TITLES['M'][buckets], TITLES['F'][buckets])
+
 
 def horse_title(gender, age):
     """Return the title of a horse based on its age and gender."""
-    title = ''
-    if age < 365:
-        title += 'weanling '
-    elif age < 365*2:
-        title += 'yearling '
-
-    if gender == 'M':
-        if age < 365*4:
-            title += 'colt'
-        else:
-            title += 'stallion'
-    else:
-        if age < 365*4:
-            title += 'filly'
-        else:
-            title += 'mare'
-    return title
+    return str(horse_titles([gender], [age])[0])
+
 
+def display_ages(ages):
+    """Return ages (in days) as approximate years and months, e.g. '3y 4m' (or '7m' for
+    horses less than a year old)."""
+    ages = np.asarray(ages, dtype=int)
+    years = ages // 365
+    months = ((ages - years*365) // 30).astype(str)
+    months = np.char.add(months, 'm')
+    return np.where(years == 0, months, np.char.add(np.char.add(years.astype(str), 'y '), months))
 
-def make_random_horses(number, max_date):
-    for i in range(number):
-        z = make_random_horse(max_date)
-        add_horse(z)
 
+def make_random_horses(number, max_date, rng=None):
+    """Add many new random horses (see make_random_horse) to the database at once.
 
-def make_random_horse(max_date):
-    """Add a new random horse to the database."""
+    Args:
+        number (int): How many horses to add.
+        max_date (datetime): Latest day the horses could have been born.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
 
+    Returns:
+        list. IDs of the new horses.
+    """
+    rng = random_context.resolve(rng)
+    ages = rng.horses.integers(1, round(LIFE_MEAN*.5), number, endpoint=True)
+    lifespans = np.round(rng.horses.normal(LIFE_MEAN, LIFE_STD, number))
+    genders = rng.horses.choice(['M', 'F'], number)
+    names = np.where(genders == 'M', rng.horses.choice(MALE_NAMES, number),
+                     rng.horses.choice(FEMALE_NAMES, number))
+    births = game_calendar.day_number(max_date) - ages
+
+    first_id = table_operations.cursor.execute(
+        "SELECT IFNULL(MAX(horse_id), 0) + 1 FROM horses").fetchone()[0]
+    horse_ids = list(range(first_id, first_id + number))
+    dna1 = genetics.random_chromosomes(number, rng)
+    dna2 = genetics.random_chromosomes(number, rng)
+
+    table_operations.insert_rows('horses', {
+        'horse_id': horse_ids,
+        'birth_date': births,
+        'expected_death': (births + lifespans).astype(int),
+        'name': names,
+        'gender': genders,
+        'owner_id': [1]*number,
+        'dna1': dna1,
+        'dna2': dna2}, commit=False)
+    phenotype.calc_properties_bulk(horse_ids, dna1, dna2)
+    entity_cache.forget('horses', horse_ids)
+    return horse_ids
+
+
+def make_random_horse(max_date, rng=None):
+    """Add a new random horse to the database.
+
+    Args:
+        max_date (datetime): Latest day the horse could have been born.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
+    """
+    rng = random_context.resolve(rng)
     output = {}
-    age = int(np.random.random_integers(1, round(LIFE_MEAN*.5)))
-    output['birth_date'] = str(max_date - datetime.timedelta(age))
-    death = round(np.random.normal(LIFE_MEAN, LIFE_STD))
-    output['expected_death'] = str(max_date - datetime.timedelta(age) + datetime.timedelta(death))
-    output['gender'] = np.random.choice(['M', 'F'])
+    age = int(rng.horses.integers(1, round(LIFE_MEAN*.5), endpoint=True))
+    output['birth_date'] = game_calendar.day_number(max_date) - age
+    death = round(rng.horses.normal(LIFE_MEAN, LIFE_STD))
+    output['expected_death'] = output['birth_date'] + death
+    output['gender'] = str(rng.horses.choice(['M', 'F']))
     if output['gender'] == 'M':
-        output['name'] = np.random.choice(HORSE_NAMES['male']+HORSE_NAMES['unisex'])
+        output['name'] = str(rng.horses.choice(MALE_NAMES))
     else:
-        output['name'] = np.random.choice(HORSE_NAMES['female'] + HORSE_NAMES['unisex'])
+        output['name'] = str(rng.horses.choice(FEMALE_NAMES))
     output['owner_id'] = 1
-    output['dna1'] = genetics.random_chromosome()
-    output['dna2'] = genetics.random_chromosome()
+    output['dna1'] = genetics.random_chromosome(rng)
+    output['dna2'] = genetics.random_chromosome(rng)
 
     return output
 
@@ -71,6 +130,7 @@ def add_horse(horse_params):
     """Add a horse to the table."""
     new_id = table_operations.insert_into_table('horses', horse_params)
     phenotype.calc_properties(new_id)
+    entity_cache.forget('horses', [new_id])
     return new_id
 
 
@@ -80,7 +140,15 @@ def trade_horse(horse_id, new_owner_id):
     table_operations.update_value('horses', command)
 
 
-def horse_sex(horse1, horse2, date):
+def trade_horses(horse_ids, new_owner_id):
+    """Transfer ownership of several horses to one owner with a single statement."""
+    horse_ids = [int(h) for h in horse_ids]
+    command = f"UPDATE horses SET owner_id = ? WHERE horse_id IN {table_operations.qmark_list(len(horse_ids))}"
+    table_operations.cursor.execute(command, [int(new_owner_id)] + horse_ids)
+    table_operations.db.commit()
+
+
+def horse_sex(horse1, horse2, date, rng=None):
     """Make two horses have sex.
 
     One horse must be male, another female. The female cannot be pregnant. Both horses
@@ -89,6 +157,7 @@ def horse_sex(horse1, horse2, date):
         horse1 (int): ID of the first horse.
         horse2 (int): ID of the second horse.
         date (datetime.date): Day on which this is occurring.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
     """
     data = table_operations.get_rows('horses', [horse1, horse2])
     data.set_index('horse_id', inplace=True)
@@ -96,10 +165,11 @@ def horse_sex(horse1, horse2, date):
     if data.loc[horse1, 'gender'] == data.loc[horse2, 'gender']:
         raise WrongGender('You need a dam and sire to make babies happen.')
 
-    if (date - data.loc[horse1, 'birth_date']).days < SEXUAL_MATURITY:
+    today = game_calendar.day_number(date)
+    if today - data.loc[horse1, 'birth_date'] < SEXUAL_MATURITY:
         raise WrongAge(f'{horse1} is too young to have sex.')
 
-    if (date - data.loc[horse2, 'birth_date']).days < SEXUAL_MATURITY:
+    if today - data.loc[horse2, 'birth_date'] < SEXUAL_MATURITY:
         raise WrongAge(f'{horse2} is too young to have sex.')
 
     lady_horse = data[data['gender'] == 'F'].iloc[0]
@@ -107,16 +177,37 @@ def horse_sex(horse1, horse2, date):
         raise PregnancyIssue(f'{lady_horse.name} is already pregnant.')
     man_horse = data[data['gender'] == 'M'].iloc[0]
 
-    num_days = round(np.random.normal(GESTATION_MEAN, GESTATION_STD))
-    due_date = date + datetime.timedelta(num_days)
-    command = f"SET due_date = '{str(due_date)}' WHERE horse_id = {lady_horse.name}"
+    num_days = round(random_context.resolve(rng).horses.normal(GESTATION_MEAN, GESTATION_STD))
+    command = f"SET due_date = {today + num_days} WHERE horse_id = {lady_horse.name}"
     table_operations.update_value('horses', command)
 
     command = f"SET impregnated_by = '{man_horse.name}' WHERE horse_id = {lady_horse.name}"
     table_operations.update_value('horses', command)
 
 
-def give_birth(horse, date, name=None, store_horse=True):
+def breed_horses(dams, sires, date, rng=None):
+    """Make many pairs of horses have sex at once (see horse_sex). All of the pregnancies
+    are written with one executemany and a single commit.
+
+    Unlike horse_sex, the pairs are not checked: every dam must be a mature, unpregnant
+    female and every sire a mature male.
+    Args:
+        dams (list): IDs of the dams.
+        sires (list): IDs of the sires, in the same order as their dams.
+        date (datetime.date): Day on which this is occurring.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
+    """
+    num_days = np.round(random_context.resolve(rng).horses.normal(GESTATION_MEAN, GESTATION_STD,
+                                                                  len(dams)))
+    today = game_calendar.day_number(date)
+    due_dates = [today + int(n) for n in num_days]
+    command = "UPDATE horses SET due_date = ?, impregnated_by = ? WHERE horse_id = ?"
+    table_operations.cursor.executemany(
+        command, zip(due_dates, [int(s) for s in sires], [int(d) for d in dams]))
+    table_operations.db.commit()
+
+
+def give_birth(horse, date, name=None, store_horse=True, rng=None):
     """Make a horse give birth to a pony.
 
     Args:
@@ -127,34 +218,37 @@ def give_birth(horse, date, name=None, store_horse=True):
         store_horse (bool): If True, will add the newly born horse to the horse table. If
             False, will not do so, and will instead return the new horse's info so that
             it can be modified and added later.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
 
     Returns:
         int. The ID of the new horse. Or dict, if add_horse==False, containing the horse
             information.
     """
+    rng = random_context.resolve(rng)
     dam = table_operations.get_rows('horses', horse).iloc[0]
 
     if dam['impregnated_by'] is None:
         raise PregnancyIssue(f'{horse} is not pregnant and so cannot give birth.')
 
-    sire = table_operations.get_rows('horses', dam['impregnated_by']).iloc[0]
+    # The sire may have died (and been archived) since
+    sire = table_operations.query_to_dataframe(
+        "SELECT * FROM all_horses WHERE horse_id = ?", [int(dam['impregnated_by'])]).iloc[0]
 
-    foal = make_random_horse(date)
+    foal = make_random_horse(date, rng)
     foal['dam'] = dam['horse_id']
     foal['sire'] = sire['horse_id']
     foal['owner_id'] = dam['owner_id']
-    foal['birth_date'] = str(date)
-    foal['expected_death'] = str(date + datetime.timedelta(
-        round(np.random.normal(LIFE_MEAN, LIFE_STD))))
+    foal['birth_date'] = game_calendar.day_number(date)
+    foal['expected_death'] = foal['birth_date'] + round(rng.horses.normal(LIFE_MEAN, LIFE_STD))
     if name is not None:
         foal['name'] = name
     else:
         if foal['gender'] == 'F':
-            foal['name'] = np.random.choice(FEMALE_NAMES, 1)[0]
+            foal['name'] = str(rng.horses.choice(FEMALE_NAMES))
         else:
-            foal['name'] = np.random.choice(MALE_NAMES, 1)[0]
+            foal['name'] = str(rng.horses.choice(MALE_NAMES))
 
-    mix_genomes(dam, sire, foal)
+    mix_genomes(dam, sire, foal, rng)
 
     command = f"SET impregnated_by = NULL WHERE horse_id = {horse}"
     table_operations.update_value('horses', command)
@@ -169,20 +263,21 @@ def give_birth(horse, date, name=None, store_horse=True):
         return foal
 
 
-def mix_genomes(dam, sire, foal):
+def mix_genomes(dam, sire, foal, rng=None):
     """Combine the genomes of dam and sire to create the foal's genome.
 
     Args:
         dam (pd.Series): dam data.
         sire (pd.Series): sire data.
         foal (dict): Data from the foal.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
 
     Returns:
         Nothing. Just updates the foal dict.
     """
 
-    foal['dna1'] = genetics.mix_chromosomes(dam['dna1'], dam['dna2'])
-    foal['dna2'] = genetics.mix_chromosomes(sire['dna1'], sire['dna2'])
+    foal['dna1'] = genetics.mix_chromosomes(dam['dna1'], dam['dna2'], rng)
+    foal['dna2'] = genetics.mix_chromosomes(sire['dna1'], sire['dna2'], rng)
 
 
 def pedigree(horse, max_depth=3, base_depth=0):
@@ -198,7 +293,8 @@ def pedigree(horse, max_depth=3, base_depth=0):
     """
     if horse is None:
         return None
-    data = table_operations.get_rows('horses', horse).iloc[0]
+    data = table_operations.query_to_dataframe(
+        "SELECT * FROM all_horses WHERE horse_id = ?", [int(horse)]).iloc[0]
     output = {}
     output['name'] = data['name']
     output['id'] = data['horse_id']
@@ -216,7 +312,7 @@ def kill_horse(horse, date):
         horse (int): ID of the horse to kill.
         date (datetime.date): Day of death.
     """
-    command = f"SET death_date = '{str(date)}' WHERE horse_id = {horse}"
+    command = f"SET death_date = {game_calendar.day_number(date)} WHERE horse_id = {horse}"
     table_operations.update_value('horses', command)
 
 
@@ -255,8 +351,11 @@ def coat(horse_id=None, horse_info=None):
         String. The name of the horses coat type
     """
     if horse_info is None:
-        horse_info = table_operations.get_rows('horses', horse_id).iloc[0]
-    return phenotype.base_color(horse_info['dna1'], horse_info['dna2'])
+        horse_info = table_operations.query_to_dataframe(
+            "SELECT * FROM all_horses WHERE horse_id = ?", [int(horse_id)]).iloc[0]
+    color = coat_table.base_color(horse_info['dna1'], horse_info['dna2'])
+    pattern = coat_table.coat_pattern(horse_info['dna1'], horse_info['dna2'])
+    return f"{color} {pattern}".strip()
 
 
 def age(horse_ids, date):
@@ -269,16 +368,13 @@ def age(horse_ids, date):
     returns:
         pd.DataFrame. One column is horse_ids, the other is ages.
     """
-    date = pd.to_datetime(date)
     try:
-        horse_ids = int(horse_ids)
-        query = f"SELECT birth_date, horse_id FROM horses WHERE horse_id = {horse_ids}"
-    except ValueError:
-        horse_ids = tuple(horse_ids)
-        query = f"SELECT birth_date, horse_id FROM horses WHERE horse_id IN {horse_ids}"
-    ages = table_operations.query_to_dataframe(query)
-    ages['age'] = ages['birth_date'].apply(lambda x: (date - x)/np.timedelta64(1, 'D'))
-    return ages[['horse_id', 'age']].copy()
+        horse_ids = [int(horse_ids)]
+    except TypeError:
+        horse_ids = [int(h) for h in horse_ids]
+    query = f"SELECT horse_id, ? - birth_date AS age FROM horses" \
+        f" WHERE horse_id IN {table_operations.qmark_list(len(horse_ids))}"
+    return table_operations.query_to_dataframe(query, [game_calendar.day_number(date)] + horse_ids)
 
 
 def race_summary(horse_ids):
@@ -307,7 +403,7 @@ def race_summary(horse_ids):
     com = "SELECT " \
           "    horse_id, place, winnings " \
           "FROM" \
-          "    race_results " \
+          "    all_race_results " \
           "WHERE " \
           f"    horse_id IN {horse_ids}"
     data = table_operations.query_to_dataframe(com)
@@ -339,17 +435,7 @@ def race_summary(horse_ids):
 
 def expected_race_life():
     """Return the age (in days) and uncertainty at which a horse can expect to run its last race."""
-    com = """
-    SELECT h.horse_id, r.date, h.birth_date
-    FROM race_results rr
-        LEFT OUTER JOIN races r ON (rr.race_id = r.race_id)
-        LEFT OUTER JOIN horses h ON (rr.horse_id = h.horse_id);
-    """
-    race_dates = table_operations.query_to_dataframe(com)
-    race_dates.drop_duplicates('horse_id', keep='last', inplace=True)
-    race_dates['age'] = race_dates['date'] - race_dates['birth_date']
-    race_dates['age'] = race_dates['age'].apply(lambda x: x/np.timedelta64(1, 'D'))
-    return race_dates['age'].mean(), race_dates['age'].std()
+    return league_stats.race_life()
 
 
 def expected_winnings(horse_id):
@@ -393,16 +479,18 @@ def all_values(dictionary, key):
     return output
 
 
-def check_for_injuries(horse_id, event):
+def check_for_injuries(horse_id, event, rng=None):
     """Roll the dice to see if a horse gets injured during an event.
 
     Args:
         horse_id (int): ID of the horse to check.
         event (str): Name of the event.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
 
     Return:
         dict. Keys are the
     """
+    rng = random_context.resolve(rng)
     query = f"SELECT * FROM horse_properties WHERE horse_id = {horse_id}"
     data = table_operations.query_to_dataframe(query).iloc[0]
     output = []
@@ -410,7 +498,7 @@ def check_for_injuries(horse_id, event):
         prob_mult = 1
         for multiplier in info['multipliers']:
             prob_mult *= data[multiplier]
-        if random.random() < info['probability']*prob_mult:
+        if rng.horses.random() < info['probability']*prob_mult:
             output += [injury]
     return output
 
@@ -433,7 +521,7 @@ def apply_damage(horse_id, part, amount, date=None):
         table_operations.cursor.execute(cmd)
 
 
-def heal_horses(owner_id='all', heal_rate='default'):
+def heal_horses(owner_id='all', heal_rate='default', days=1):
     """
     Reduce the damage on all horses' body parts. Typically called each day.
     Args:
@@ -441,12 +529,15 @@ def heal_horses(owner_id='all', heal_rate='default'):
             heal horses regardless of owner.
         heal_rate (float or 'default'): How much to heal each horse. If 'default' will
             use the heal rate given in the parameter file.
+        days (int): Number of days of healing to apply at once. Since damage never drops
+            below 0, n days of healing is the same as a single heal of n*heal_rate.
     Returns:
         None.
 
     """
     if heal_rate == 'default':
         heal_rate = HEAL_RATE
+    heal_rate *= days
 
     if owner_id == 'all':
         command = "UPDATE horses SET leg_damage = MAX(0, leg_damage - ?)"
@@ -468,17 +559,21 @@ def heal_horses(owner_id='all', heal_rate='default'):
         table_operations.cursor.execute(command, [heal_rate, owner_id])
 
 
-def train_horses(owner_id='all', training_amount=0):
+def train_horses(owner_id='all', training_amount=0, days=1):
     """
     Change the training of horses. Typically called each day.
     Args:
         owner_id (int or 'all'): Train all horses owned by this person. If 'all', will
             train horses regardless of owner.
         training_amount (float): How much to train each horse.
+        days (int): Number of days of training to apply at once. Training is clamped to
+            [0, MAX_TRAINING], so n days is the same as a single change of
+            n*training_amount.
     Returns:
         None.
 
     """
+    training_amount *= days
     if owner_id == 'all':
         command = "UPDATE horses SET training = MIN(MAX(0, training + ?), ?)"
         table_operations.cursor.execute(command, [training_amount, MAX_TRAINING])
@@ -498,25 +593,21 @@ def raceable_horses(owner_id=None):
     Return:
         List. List of all ids of horses.
     """
-    if owner_id is None:
-        command = """
-        SELECT horse_id from horses WHERE
-            death_date is NULL 
-            and leg_damage + heart_damage + ankle_damage < ?
-        """
-        params = [HEALTH_CUTOFF]
-    else:
-        command = """
-        SELECT horse_id from horses WHERE
-            owner_id = ?
-            and death_date is NULL
-            and leg_damage + heart_damage + ankle_damage < ?
-        """
-        params =[owner_id, HEALTH_CUTOFF]
+    condition, params = raceable_condition(owner_id)
+    command = f"SELECT horse_id from horses WHERE {condition}"
     horses = table_operations.query_to_dataframe(command, params=params)['horse_id'].values
     return [int(x) for x in horses]
 
 
+def raceable_condition(owner_id=None):
+    """Return the condition (for a query on the horses table) which picks out the horses
+    of an owner which are healthy enough to race, and its parameters (see raceable_horses)."""
+    if owner_id is None:
+        return "death_date is NULL and leg_damage + heart_damage + ankle_damage < ?", [HEALTH_CUTOFF]
+    return ("owner_id = ? and death_date is NULL and leg_damage + heart_damage + ankle_damage < ?",
+            [owner_id, HEALTH_CUTOFF])
+
+
 class WrongGender(ValueError):
     """Called when the provided horse is the wrong gender."""
 
@@ -0,0 +1,154 @@
+from PyQt5 import QtCore
+import table_operations as to
+import horse_functions as hf
+
+"""
+Horse list models
+
+Models of the horses table for Qt item views (e.g. QListView), so that a list of horses
+doesn't need a widget item for every horse. A HorseListModel is given the condition which
+picks out its horses (e.g. the mares of the player which can breed):
+
+    - Only the number of matching horses is counted up front. Rows are read a page at a
+      time, as the view scrolls down to them (canFetchMore/fetchMore).
+    - Sorting and filtering are done by the database (order_by and set_query), never by
+      reading every horse into Python.
+    - Setting the same condition again (e.g. when a box is shown again) refreshes the
+      rows already loaded, and only tells the view about the rows that changed, unless
+      horses were added or removed.
+
+    model = HorseListModel("owner_id = ? AND death_date IS NULL", [owner])
+    view.setModel(model)
+    horse_id = model.horse_id(view.currentIndex())
+
+age_labels labels a page with the names, titles and ages of its horses, working them out
+for the whole page at once.
+"""
+
+PAGE_SIZE = 100  # Rows read from the database at a time
+HORSE_ID_ROLE = QtCore.Qt.UserRole  # Role under which the model gives the horse_id of a row
+
+
+def age_labels(page, day):
+    """
+    Label each horse of a page with its name, title and age, e.g. 'Rosie (yearling filly, 1y 2m)'.
+    Args:
+        page (pd.DataFrame): Page of horses (see HorseListModel.label).
+        day (datetime): Current day.
+
+    Returns:
+        list. The label of each horse.
+    """
+    ages = hf.horse_ages(page['birth_date'], day)
+    titles = hf.horse_titles(page['gender'], ages)
+    return [f"{name} ({title}, {age})"
+            for name, title, age in zip(page['name'], titles, hf.display_ages(ages))]
+
+
+class HorseListModel(QtCore.QAbstractListModel):
+    """A lazily loaded list of the horses matching an SQL condition.
+
+    Attributes:
+        where (str): Condition on the horses table, e.g. 'owner_id = ?'.
+        params (list): Values for the placeholders in where.
+        order_by (str): Column of the horses table to sort by.
+        label (callable): Takes a DataFrame of a page of horses (horse_id, name, gender and
+            birth_date) and returns the text to show for each of them.
+        page_size (int): Rows to read at a time.
+    """
+    def __init__(self, where='1', params=(), order_by='name', label=None, page_size=PAGE_SIZE,
+                 parent=None):
+        super(HorseListModel, self).__init__(parent)
+        self.where = where
+        self.params = list(params)
+        self.order_by = order_by
+        self.label = label if label is not None else (lambda page: list(page['name']))
+        self.page_size = page_size
+        self._ids = []
+        self._labels = []
+        self._total = 0
+
+    def set_query(self, where, params=()):
+        """Show the horses matching a condition. If it is the condition already shown, the
+        loaded rows are refreshed rather than read again from the first page."""
+        if where == self.where and list(params) == self.params:
+            self.refresh()
+            return
+        self.where = where
+        self.params = list(params)
+        self._reload()
+
+    def refresh(self):
+        """
+        Re-read the rows that have been loaded. If the same horses still match, in the
+        same order, only the rows whose text changed are updated. Otherwise the model is
+        reset, keeping as many rows loaded as before.
+        """
+        total = self._count()
+        page = self._page(0, max(len(self._ids), min(self.page_size, total)))
+        ids, labels = page['horse_id'].tolist(), self.label(page)
+        if total != self._total or ids != self._ids:
+            self.beginResetModel()
+            self._ids, self._labels, self._total = ids, labels, total
+            self.endResetModel()
+            return
+        changed = [row for row, (old, new) in enumerate(zip(self._labels, labels)) if old != new]
+        self._labels = labels
+        for row in changed:
+            self.dataChanged.emit(self.index(row), self.index(row), [QtCore.Qt.DisplayRole])
+
+    def horse_id(self, index):
+        """Return the horse_id in the row of a QModelIndex (None if the index is invalid)."""
+        if not index.isValid():
+            return None
+        return self._ids[index.row()]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._ids)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._ids):
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self._labels[index.row()]
+        if role == HORSE_ID_ROLE:
+            return self._ids[index.row()]
+        return None
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and len(self._ids) < self._total
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return
+        page = self._page(len(self._ids), self.page_size)
+        if len(page) == 0:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), len(self._ids), len(self._ids) + len(page) - 1)
+        self._ids += page['horse_id'].tolist()
+        self._labels += self.label(page)
+        self.endInsertRows()
+
+    def _reload(self):
+        """Forget the loaded rows, count the matching horses again and load the first page."""
+        self.beginResetModel()
+        self._total = self._count()
+        page = self._page(0, self.page_size)
+        self._ids, self._labels = page['horse_id'].tolist(), self.label(page)
+        self.endResetModel()
+
+    def _count(self):
+        query = f"SELECT COUNT(*) FROM horses WHERE {self.where}"
+        return to.cursor.execute(query, self.params).fetchone()[0]
+
+    def _page(self, offset, number):
+        """Return number matching horses, skipping the first offset, in the sort order."""
+        query = f"""
+        SELECT horse_id, name, gender, birth_date FROM horses
+        WHERE {self.where}
+        ORDER BY {self.order_by}, horse_id
+        LIMIT ? OFFSET ?
+        """
+        page = to.query_to_dataframe(query, self.params + [number, offset])
+        page['horse_id'] = page['horse_id'].astype(int)
+        return page
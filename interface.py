@@ -1,8 +1,8 @@
 import sys
 import os
-import re
 from math import inf
 import numpy as np
+import pandas as pd
 from PyQt5 import QtWidgets, uic, QtCore, QtGui
 from PyQt5.QtWidgets import QApplication, QMessageBox, QMdiSubWindow, QLabel, QWidget, QPushButton,\
     QFrame, QScrollArea, QFileDialog
@@ -12,18 +12,30 @@ import owner_functions as of
 import horse_functions as hf
 import employee_functions as ef
 import estate
+import valuation
+import entity_cache
+import game_calendar
 import text_operations as text
+from text_operations import convert_to_links
+from simulation_thread import SimulationWorker
+from horse_models import HorseListModel, HORSE_ID_ROLE, age_labels
 from game_parameters.constants import *
 
 
 class MainScreen(QtWidgets.QMainWindow):
     max_messages = 20  # maximum number of messages to display in the message box
+    repaint_interval = 100  # milliseconds to wait between repaints of the day, money and messages
+    message_separator = '<body>------------------</body><br></br>'
 
     def __init__(self):
         self.app = QApplication(sys.argv)
         super(MainScreen, self).__init__()
         uic.loadUi(os.path.join('ui_files', 'main_screen.ui'), self)
         self.messages = []
+        self._setup_repaints()
+        self.simulation = None  # SimulationWorker of the job running in the background
+        self.simulation_thread = None
+        self._close_when_finished = False  # Set if the window was closed during a job
 
         self.game = Game('19900101', gui=self)
 
@@ -34,6 +46,65 @@ class MainScreen(QtWidgets.QMainWindow):
 
         sys.exit(self.app.exec())
 
+    def _setup_repaints(self):
+        """Changes to the day, money and messages are only buffered when they happen, and
+        shown by repaint_now, which is run at most every repaint_interval."""
+        self._pending_messages = []
+        self._pending_day = None
+        self._money_changed = False
+        self._money = None  # The new amount of money, if it is known without asking the database
+        self._shown_messages = 0  # Messages in the message box, which can be more than self.messages
+        self._redraw_messages = False
+        self.repaint_timer = QtCore.QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.setInterval(self.repaint_interval)
+        self.repaint_timer.timeout.connect(self.repaint_now)
+
+    def _schedule_repaint(self):
+        if not self.repaint_timer.isActive():
+            self.repaint_timer.start()
+
+    def repaint_now(self):
+        """Show every change to the day, money and messages that is waiting to be shown."""
+        self.repaint_timer.stop()
+        if self._pending_day is not None:
+            self.day_display.setText(f'{self._pending_day.date()}')
+            self._pending_day = None
+        # While the simulation thread has the database the money has to come from it
+        if self._money_changed and (self._money is not None or self.simulation is None):
+            money = of.money(self.game.owner) if self._money is None else self._money
+            self.money_display.setText(f'Cash: ${money}')
+            self._money_changed = False
+            self._money = None
+        if self._pending_messages or self._redraw_messages:
+            self._show_messages(self._pending_messages)
+            self._pending_messages = []
+
+    def _show_messages(self, messages):
+        """
+        Put messages at the top of the message box. They are inserted in front of the
+        messages already shown rather than redrawing all of them, and the old messages are
+        only trimmed off once there are twice as many as max_messages.
+        Args:
+            messages (list): (day, message with its links) pairs, oldest first.
+
+        Returns:
+            None.
+        """
+        new = [f'<body>{day}: </body>' + msg for day, msg in reversed(messages)][:self.max_messages]
+        self.messages = (new + self.messages)[:self.max_messages]
+        self._shown_messages += len(new)
+        if self._redraw_messages or self._shown_messages > 2 * self.max_messages \
+                or self._shown_messages == len(new):
+            self.message_box.setHtml(self.message_separator.join(self.messages))
+            self._shown_messages = len(self.messages)
+            self._redraw_messages = False
+        else:
+            cursor = QtGui.QTextCursor(self.message_box.document())
+            cursor.movePosition(QtGui.QTextCursor.Start)
+            # The extra break makes up for the one lost where the inserted html meets the old
+            cursor.insertHtml(self.message_separator.join(new) + self.message_separator + '<br>')
+
     def _setup_sub_windows(self):
         self.currently_showing_box = None
 
@@ -65,18 +136,117 @@ class MainScreen(QtWidgets.QMainWindow):
         self.actionBuildings.triggered.connect(self._show_building_box)
         self.actionEmployees.triggered.connect(self._show_employee_box)
         self.actionHorse_Properties.triggered.connect(self._show_property_window)
-        self.actionQuick.triggered.connect(lambda x: self.game.generate_history(0, 25))
-        self.action10_Year.triggered.connect(lambda x: self.game.generate_history(10*365, 25))
-        self.action20_Year.triggered.connect(lambda x: self.game.generate_history(20*365, 25))
+        self.actionQuick.triggered.connect(
+            lambda x: self._run_in_background(self.game.generate_history, 0, 25))
+        self.action10_Year.triggered.connect(
+            lambda x: self._run_in_background(self.game.generate_history, 10*365, 25))
+        self.action20_Year.triggered.connect(
+            lambda x: self._run_in_background(self.game.generate_history, 20*365, 25))
         self.actionLoad.triggered.connect(self._load_game)
         self.actionSave.triggered.connect(self._save_game)
         self.actionGod_mode.triggered.connect(self.game.enable_god_mode)
 
     def _next_day_push(self):
         self.game.run_days(1)
+        self.repaint_now()
 
     def _next_n_days_push(self):
-        self.game.run_days(self.day_amount_entry.value())
+        if self.simulation is not None:
+            self.simulation.stop()
+            self.next_n_days.setText('Stopping...')
+            return
+        self._run_in_background(self.game.run_days, self.day_amount_entry.value(), fast_forward=True)
+
+    def _run_in_background(self, job, *args, **kwargs):
+        """
+        Run a job of the game (e.g. game.run_days) on the simulation thread. Everything
+        which could read the database is disabled until it finishes, apart from the next n
+        days button, which stops the job.
+        Args:
+            job (callable): Method of the game to run.
+            *args, **kwargs: Arguments for the job.
+
+        Returns:
+            None.
+        """
+        if self.simulation is not None:
+            return
+        self.simulation = SimulationWorker(self.game, job, *args, **kwargs)
+        self.simulation.max_messages = self.max_messages
+        self.simulation_thread = QtCore.QThread()
+        self.simulation.moveToThread(self.simulation_thread)
+        self.simulation_thread.started.connect(self.simulation.run)
+        self.simulation.progress.connect(self._show_progress)
+        self.simulation.updated.connect(self._apply_update)
+        self.simulation.failed.connect(self._show_failure)
+        self.simulation.join_race_requested.connect(self._ask_to_join_race_and_wait,
+                                                    QtCore.Qt.BlockingQueuedConnection)
+        self.simulation.name_requested.connect(self._name_foal_for_simulation,
+                                               QtCore.Qt.BlockingQueuedConnection)
+        self.simulation.finished.connect(self.simulation_thread.quit)
+        self.simulation_thread.finished.connect(self._simulation_finished)
+
+        self._set_busy(True)
+        self.next_n_days.setText('Stop')
+        self.simulation_thread.start()
+
+    def _set_busy(self, busy):
+        """Enable or disable everything that could read the database."""
+        self.next_day.setEnabled(not busy)
+        self.day_amount_entry.setEnabled(not busy)
+        self.menubar.setEnabled(not busy)
+        self.mdi.setEnabled(not busy)
+
+    def _show_progress(self, done, total):
+        self.next_n_days.setText(f'Stop ({done}/{total} days)')
+
+    def _apply_update(self, messages, day, money):
+        """Buffer what the simulation thread has sent since its last update."""
+        self._pending_messages += messages
+        if day is not None:
+            self.update_day(day)
+        if money is not None:
+            self.update_money(money)
+        self._schedule_repaint()
+
+    def _show_failure(self, error):
+        QMessageBox.critical(self, 'Simulation Failed', error)
+
+    def _simulation_finished(self):
+        self.simulation.deleteLater()
+        self.simulation_thread.deleteLater()
+        self.simulation = None
+        self.simulation_thread = None
+        self._set_busy(False)
+        self._change_n_days_text()
+        self.update_day(self.game.day)
+        self.update_money()
+        self.repaint_now()
+        if self._close_when_finished:
+            self.close()
+
+    def _ask_to_join_race_and_wait(self):
+        """Invite the player to a race for the simulation thread, which is waiting until the
+        race has been run or declined."""
+        self.ask_to_join_race()
+        if self.race_window.isVisible():
+            loop = QtCore.QEventLoop()
+            self.race_window.closed.connect(loop.quit)
+            loop.exec()
+            self.race_window.closed.disconnect(loop.quit)
+
+    def _name_foal_for_simulation(self, mother, foal_gender):
+        self.simulation.name = self.ask_to_name_foal(mother, foal_gender)
+
+    def closeEvent(self, event):
+        # The window can't wait for the job here: the job may need the GUI thread before it
+        # stops (e.g. to name a foal). It is closed again once the job has finished instead.
+        if self.simulation is not None:
+            self.simulation.stop()
+            self._close_when_finished = True
+            event.ignore()
+            return
+        super(MainScreen, self).closeEvent(event)
 
     def _change_n_days_text(self):
         days = self.day_amount_entry.value()
@@ -86,11 +256,13 @@ class MainScreen(QtWidgets.QMainWindow):
             self.next_n_days.setText(f'Play {days} Days')
 
     def update_day(self, date):
-        self.day_display.setText(f'{date.date()}')
+        self._pending_day = date
+        self._schedule_repaint()
 
-    def update_money(self):
-        money = of.money(self.game.owner)
-        self.money_display.setText(f'Cash: ${money}')
+    def update_money(self, money=None):
+        self._money_changed = True
+        self._money = money
+        self._schedule_repaint()
 
     def _show_breeding_box(self):
         try:
@@ -137,6 +309,8 @@ class MainScreen(QtWidgets.QMainWindow):
     def display_link_info(self, url):
         """Display information about the thing that was just clicked on. Also show
         information in the pedigree window if it is open."""
+        if self.simulation is not None:
+            return
         _, entity_type, id_ = url.toString().split('#')
         id_ = int(id_)
         if entity_type == 'horses':
@@ -154,14 +328,10 @@ class MainScreen(QtWidgets.QMainWindow):
         """Display an update in the main window."""
         if clear:
             self.messages = []
-        msg = convert_to_links(msg)
-        msg = f'<body>{self.game.day}: </body>' + msg
-        self.messages = [msg] + self.messages
-        if len(self.messages) > self.max_messages:
-            self.messages.pop(-1)
-
-        total_message = '<body>------------------</body><br></br>'.join(self.messages)
-        self.message_box.setText(total_message)
+            self._pending_messages = []
+            self._redraw_messages = True
+        self._pending_messages.append((self.game.day, convert_to_links(msg)))
+        self._schedule_repaint()
 
     def ask_to_join_race(self):
         reply = QMessageBox.question(
@@ -181,8 +351,8 @@ class MainScreen(QtWidgets.QMainWindow):
         return nw.name_entry.toPlainText()
 
     def show_list_horse_info(self, t):
-        """Display the information of a horse in the list."""
-        info = self.game.horse_info(t.horse_id)
+        """Display the information of the horse at an index of a HorseListModel."""
+        info = self.game.horse_info(t.data(HORSE_ID_ROLE))
         info = convert_to_links(info)
         self.entity_info_box.setText(info)
 
@@ -207,6 +377,10 @@ class BreedingBox(QMdiSubWindow):
         super(BreedingBox, self).__init__()
         uic.loadUi(os.path.join('ui_files', 'breed_box.ui'), self)
         self.setWindowFlags(QtCore.Qt.FramelessWindowHint)
+        self.dams = HorseListModel(label=self._label_with_age, parent=self)
+        self.dam_selection.setModel(self.dams)
+        self.sires = HorseListModel(label=self._label_with_age, parent=self)
+        self.sire_selection.setModel(self.sires)
         self.input_connect()
         self.hide()
 
@@ -214,25 +388,17 @@ class BreedingBox(QMdiSubWindow):
         self._populate_breeding_lists()
 
     def _populate_breeding_lists(self):
-        """Add available horses to the list of mares and sires to breed."""
-        horses = self.main.game.breedable_horses(self.game.owner)
-        self.dam_selection.clear()
-        for i, dam in horses[horses['gender'] == 'F'].iterrows():
-            item = QtWidgets.QListWidgetItem()
-            item.horse_id = dam['horse_id']
-            item.setData(0, f"{dam['name']}")
-            self.dam_selection.insertItem(1, item)
-
-        self.sire_selection.clear()
-        for i, sire in horses[horses['gender'] == 'M'].iterrows():
-            item = QtWidgets.QListWidgetItem()
-            item.horse_id = sire['horse_id']
-            item.setData(0, f"{sire['name']}")
-            self.sire_selection.insertItem(1, item)
+        """Show the available horses in the lists of mares and sires to breed."""
+        condition, params = self.game.breedable_condition(self.game.owner)
+        self.dams.set_query(f"{condition} and gender = 'F'", params)
+        self.sires.set_query(f"{condition} and gender = 'M'", params)
+
+    def _label_with_age(self, page):
+        return age_labels(page, self.game.day)
 
     def input_connect(self):
-        self.dam_selection.itemClicked.connect(self.main.show_list_horse_info)
-        self.sire_selection.itemClicked.connect(self.main.show_list_horse_info)
+        self.dam_selection.clicked.connect(self.main.show_list_horse_info)
+        self.sire_selection.clicked.connect(self.main.show_list_horse_info)
         self.breed_button.clicked.connect(self._breed)
 
     def _display_link_info(self, url):
@@ -255,27 +421,32 @@ class BreedingBox(QMdiSubWindow):
     def _breed(self):
         """Breed the selected horses."""
         try:
-            dam = self.dam_selection.selectedItems()[0]
-        except:
+            dam = self.dam_selection.selectedIndexes()[0]
+        except IndexError:
             self.main.display_message("A dam must be selected for breeding.")
             return
         try:
-            sire = self.sire_selection.selectedItems()[0]
-        except:
+            sire = self.sire_selection.selectedIndexes()[0]
+        except IndexError:
             self.main.display_message("A sire must be selected for breeding.")
             return
-        hf.horse_sex(dam.horse_id, sire.horse_id, self.game.day)
-        self.main.display_message(f"{dam.text()} and {sire.text()} have bred.")
+        hf.horse_sex(dam.data(HORSE_ID_ROLE), sire.data(HORSE_ID_ROLE), self.game.day,
+                     rng=self.game.rng)
+        self.main.display_message(
+            f"[horses:{dam.data(HORSE_ID_ROLE)}] and [horses:{sire.data(HORSE_ID_ROLE)}] have bred.")
         self.update()
 
 
 class RaceWindow(QtWidgets.QMainWindow):
+    closed = QtCore.pyqtSignal()  # The window was hidden, with or without running the race
 
     def __init__(self, main_screen, game):
         self.main = main_screen
         self.game = game
         super(RaceWindow, self).__init__()
         uic.loadUi(os.path.join('ui_files', 'race_screen.ui'), self)
+        self.horses = HorseListModel(label=self._label_with_age, parent=self)
+        self.horse_selection.setModel(self.horses)
 
         self.input_connect()
 
@@ -289,20 +460,24 @@ class RaceWindow(QtWidgets.QMainWindow):
         self.race_info.setText(msg_text)
         self._update_number_needed()
 
+    def _label_with_age(self, page):
+        return age_labels(page, self.game.day)
+
     def _refresh_horse_list(self):
-        self.horse_selection.clear()
         self.race_horses.clear()
-        for h in hf.raceable_horses(self.game.owner):
-            item = QtWidgets.QListWidgetItem()
-            item.horse_id = h
-            name = to.get_rows('horses', [h])['name'].values[0]
-            item.setData(0, f"{name}")
-            self.horse_selection.insertItem(1, item)
+        self._filter_horse_list()
+
+    def _filter_horse_list(self):
+        """Show the raceable horses of the player which haven't been entered yet."""
+        condition, params = hf.raceable_condition(self.game.owner)
+        entered = [self.race_horses.item(x).horse_id for x in range(self.race_horses.count())]
+        self.horses.set_query(f"{condition} and horse_id NOT IN {to.qmark_list(len(entered))}",
+                              params + entered)
 
     def input_connect(self):
         self.entity_info_box.anchorClicked.connect(self._display_link_info)
-        self.horse_selection.itemDoubleClicked.connect(self._add_horse_to_race)
-        self.horse_selection.itemClicked.connect(self._show_list_horse_info)
+        self.horse_selection.doubleClicked.connect(self._add_horse_to_race)
+        self.horse_selection.clicked.connect(self.main.show_list_horse_info)
         self.race_horses.itemDoubleClicked.connect(self._remove_horse_from_race)
         self.race_horses.itemClicked.connect(self._show_list_horse_info)
         self.race_begin_button.clicked.connect(self._send_horses_to_race)
@@ -325,16 +500,19 @@ class RaceWindow(QtWidgets.QMainWindow):
         info = convert_to_links(info)
         self.entity_info_box.setText(info)
 
-    def _add_horse_to_race(self, horse):
+    def _add_horse_to_race(self, index):
         """Add a horse from the horse list to the race list."""
-        horse = self.horse_selection.takeItem(self.horse_selection.row(horse))
-        self.race_horses.addItem(horse)
+        item = QtWidgets.QListWidgetItem()
+        item.horse_id = index.data(HORSE_ID_ROLE)
+        item.setData(0, index.data())
+        self.race_horses.addItem(item)
+        self._filter_horse_list()
         self._update_number_needed()
 
     def _remove_horse_from_race(self, horse):
         """Remove a horse from the race list."""
-        horse = self.race_horses.takeItem(self.race_horses.row(horse))
-        self.horse_selection.addItem(horse)
+        self.race_horses.takeItem(self.race_horses.row(horse))
+        self._filter_horse_list()
         self._update_number_needed()
 
     def _update_number_needed(self):
@@ -360,6 +538,10 @@ class RaceWindow(QtWidgets.QMainWindow):
         self.game.run_race(player_horses=[])
         self.hide()
 
+    def hideEvent(self, event):
+        self.closed.emit()
+        super(RaceWindow, self).hideEvent(event)
+
 
 class TradeBox(QMdiSubWindow):
     def __init__(self, main_screen, game):
@@ -368,6 +550,8 @@ class TradeBox(QMdiSubWindow):
         super(TradeBox, self).__init__()
         uic.loadUi(os.path.join('ui_files', 'trade_box.ui'), self)
         self.setWindowFlags(QtCore.Qt.FramelessWindowHint)
+        self.horses = HorseListModel("0", label=self._label_with_value, parent=self)
+        self.horse_selection.setModel(self.horses)
         self.input_connect()
         self.hide()
 
@@ -377,8 +561,8 @@ class TradeBox(QMdiSubWindow):
         self.counterparty = 2
 
     def input_connect(self):
-        self.horse_selection.itemClicked.connect(self.main.show_list_horse_info)
-        self.horse_selection.itemClicked.connect(self._keep_horse_selection)
+        self.horse_selection.clicked.connect(self.main.show_list_horse_info)
+        self.horse_selection.clicked.connect(self._keep_horse_selection)
         self.counterparty_selection.currentIndexChanged.connect(self._populate_horse_list)
         self.counterparty_selection.currentIndexChanged.connect(self._keep_counterparty_selection)
         self.buy_radio.toggled.connect(self._populate_horse_list)
@@ -386,9 +570,9 @@ class TradeBox(QMdiSubWindow):
         self.send_offer_button.clicked.connect(self._offer)
 
     def update(self):
-        self._populate_horse_list()
         self._populate_owner_list()
         self._set_selected_counterparty()
+        self._populate_horse_list()
         self._set_selected_horse()
 
     def _populate_horse_list(self):
@@ -403,20 +587,22 @@ class TradeBox(QMdiSubWindow):
         else:
             owner_id = counterparty
             self.horse_selection_label.setText('Their Horses')
-        self.horse_selection.clear()
         if owner_id != 1:
-            horse_ids = self.main.game.living_horses(owner_id)
-            for horse in horse_ids:
-                name = to.get_column('horses', 'name', horse).iloc[0]['name']
-                item = QtWidgets.QListWidgetItem()
-                item.horse_id = horse
-                item.setData(0, name)
-                self.horse_selection.insertItem(1, item)
+            self.horses.set_query('owner_id = ? AND death_date IS NULL', [owner_id])
+        else:
+            self.horses.set_query('0')
         if counterparty != 1:
             self.price_entry.setEnabled(True)
 
         self._set_selected_horse()
 
+    def _label_with_value(self, page):
+        """Label each horse of a page of the horse list with its name, age and value."""
+        values = valuation.horse_values(page['horse_id'], self.game.day)
+        ages = hf.display_ages(hf.horse_ages(page['birth_date'], self.game.day))
+        return [f"{name} ({age}, ${values[horse]:,.0f})"
+                for horse, name, age in zip(page['horse_id'], page['name'], ages)]
+
     def _display_link_info(self, url):
         """Display information about the thing that was just clicked on."""
         _, entity_type, id_ = url.toString().split('#')
@@ -443,7 +629,7 @@ class TradeBox(QMdiSubWindow):
             self.main.display_message("That ain't a number!")
             return
         try:
-            horse = self.horse_selection.selectedItems()[0].horse_id
+            horse = self.horse_selection.selectedIndexes()[0].data(HORSE_ID_ROLE)
         except IndexError:
             self.main.display_message("You gotta select a horse, partner.")
             return
@@ -503,39 +689,40 @@ class TradeBox(QMdiSubWindow):
 
     def _populate_owner_list(self):
         """Put owner names in the owner selection dropdown."""
+        # Without signals, so the horse list isn't refilled for every change to the list
+        self.counterparty_selection.blockSignals(True)
         self.counterparty_selection.clear()
-        for i, row in to.get_column('owners', 'name').iterrows():
+        for i, row in entity_cache.select('owners').iterrows():
             if row['owner_id'] != self.game.owner:
                 item = QtWidgets.QListWidgetItem()
                 item.owner_id = row['owner_id']
                 item.setData(0, row['name'])
-                self.counterparty_selection.blockSignals(True)
                 if item.owner_id == self.game.wild:
                     self.counterparty_selection.addItem('Abattoir', userData=row['owner_id'])
                 else:
                     self.counterparty_selection.addItem(row['name'], userData=row['owner_id'])
-                self.counterparty_selection.blockSignals(False)
+        self.counterparty_selection.blockSignals(False)
 
     def _keep_horse_selection(self, t):
         """Store which horse was selected so that it can be recalled later."""
         buying = self.buy_radio.isChecked()
         if not buying:
-            self.my_horse = self.horse_selection.currentRow()
+            self.my_horse = self.horse_selection.currentIndex().row()
         else:
             self.their_horses[self.counterparty_selection.currentIndex()] =\
-                self.horse_selection.currentRow()
+                self.horse_selection.currentIndex().row()
 
     def _set_selected_horse(self):
         """Set the currently selected horse based on what had been previously selected."""
         if self.buy_radio.isChecked():
             try:
-                self.horse_selection.setCurrentRow(
-                    self.their_horses[self.counterparty_selection.currentIndex()])
+                self.horse_selection.setCurrentIndex(
+                    self.horses.index(self.their_horses[self.counterparty_selection.currentIndex()]))
             except KeyError:
                 pass
         else:
             try:
-                self.horse_selection.setCurrentRow(self.my_horse)
+                self.horse_selection.setCurrentIndex(self.horses.index(self.my_horse))
             except TypeError:
                 pass
 
@@ -625,17 +812,18 @@ class PropertyWindow(QtWidgets.QMainWindow):
         self.input_connect()
 
     def update(self, horse):
-        data = to.get_rows('horse_properties', [horse]).iloc[0]
-        due_date = to.query_to_dataframe(
-            "SELECT due_date FROM horses WHERE horse_id = ?", [horse])['due_date'].values[0]
+        data = to.query_to_dataframe(
+            "SELECT * FROM all_horse_properties WHERE horse_id = ?", [horse]).iloc[0]
+        horse_data = to.query_to_dataframe("SELECT * FROM all_horses WHERE horse_id = ?", [horse]).iloc[0]
+        due_date = None if pd.isna(horse_data['due_date']) else \
+            game_calendar.from_day_number(horse_data['due_date']).date()
 
         msg = ''
         for prop, val in data.iteritems():
             msg += f'{prop}:  {val} \n'
 
-        data = to.get_rows('horses', [horse]).iloc[0]
         for prop in ['leg_damage',  'ankle_damage', 'heart_damage']:
-            msg += f'{prop}:  {data[prop]} \n'
+            msg += f'{prop}:  {horse_data[prop]} \n'
         msg += f'Due Date: {due_date}\n'
         msg += f'Estimated Value: {of.horse_value(horse, self.game.day)}\n'
 
@@ -678,9 +866,9 @@ class NamingDialog(QtWidgets.QDialog):
     def _random_name(self):
         """Generate a random name."""
         if self.gender == 'M':
-            name = np.random.choice(hf.MALE_NAMES, 1)[0]
+            name = self.main.game.rng.names.choice(hf.MALE_NAMES, 1)[0]
         else:
-            name = np.random.choice(hf.FEMALE_NAMES, 1)[0]
+            name = self.main.game.rng.names.choice(hf.FEMALE_NAMES, 1)[0]
         self.name_entry.setText(name)
 
     def _use_name(self):
@@ -886,18 +1074,17 @@ class EmployeeBox(QMdiSubWindow):
 
         # Update employee tiles
         tab = self.tabWidget.currentWidget()
-        employees = to.query_to_dataframe("SELECT * FROM employees WHERE employer = 1 AND employee_type = ?", [tab.employee_type])
+        employees = entity_cache.select('employees', 'employer IN (?, ?) AND employee_type = ?',
+                                        [ef.UNEMPLOYED, self.game.owner, tab.employee_type])
         hire = tab.children()[1].children()[0].children()[0]
         fire = tab.children()[2].children()[0].children()[0]
         self._clear_widget(hire, EmployeeTile)
         self._clear_widget(fire, EmployeeTile)
-        for r, employee in employees.iterrows():
+        for r, employee in employees[employees['employer'] == ef.UNEMPLOYED].iterrows():
             tile = EmployeeTile(employee, tab, self.main, self, for_hire=True)
             hire.layout().addWidget(tile)
 
-        employees = to.query_to_dataframe(
-            "SELECT * FROM employees WHERE employer = ? AND employee_type = ?", [self.game.owner, tab.employee_type])
-        for r, employee in employees.iterrows():
+        for r, employee in employees[employees['employer'] == self.game.owner].iterrows():
             tile = EmployeeTile(employee, tab, self.main, self, for_hire=False)
             fire.layout().addWidget(tile)
 
@@ -974,43 +1161,5 @@ class EmployeeTile(QFrame):
             self.employee_box.fired.emit(self.info['employee_id'])
 
 
-def convert_to_links(msg):
-    """Convert a string containing link indicators so that it contains proper links.
-
-    To indicate a link in a string, use the form [TABLE_NAME:ID]. e.g. [horses:21] to
-    indicate a link to the horse with the ID 21.
-    """
-    pattern = '\[[^\]]*]'
-    links = re.findall(pattern, msg)
-    normal_text = re.split(pattern, msg)
-    output = ''
-    for i, link in enumerate(links):
-        info = link.strip('[]').split(':')
-        output += normal_text[i]
-        output += format_link(info[0], int(info[1]))
-    output += normal_text[-1]
-    return output
-
-
-def format_link(table, id_, name=None):
-    """Create a string to use as a link in the GUI.
-
-    Args:
-        table (str): The type of thing to link to (horses, owners, etc.)
-        id_ (str or int): ID of the thing to link to.
-        name (str or None): Name to use as the hyperlink code. If None, will use the
-            name as stored in the database. If there is no column 'name', will
-            default to the id.
-    Returns:
-          str
-    """
-    if name is None:
-        info = to.get_rows(table, id_).iloc[0]
-        try:
-            name = info['name']
-        except KeyError:
-            name = id_
-    return f"<a href=\"#{table}#{id_}\">{name}</a>"
-
-
-MainScreen()
+if __name__ == '__main__':
+    MainScreen()
@@ -0,0 +1,156 @@
+import math
+import table_operations as to
+import game_calendar
+
+"""
+League statistics
+
+Running totals describing the league as a whole, kept in the league_stats and last_races
+tables of the save so that they can be read in constant time rather than recalculated from
+every race ever run:
+
+    races_per_day - The number of races run divided by the number of days from the first
+        race run to the last.
+    race_life - The mean and standard deviation of the age at which horses ran their last
+        (i.e. most recent) race.
+
+Game.race calls record_race after every race (and stats before it, so that a race being
+run is never both rebuilt and recorded). The mean and standard deviation are kept
+with Welford's algorithm. A horse that races again has the age of its previous last race
+swapped for its new one, so last_races holds that age for every horse that has raced.
+If a save doesn't have the statistics yet (e.g. it was made before they existed), they are
+rebuilt from the races and race_results tables the first time they are needed.
+"""
+
+
+def stats():
+    """Return the league statistics as a dict, rebuilding them first if they are missing."""
+    row = to.cursor.execute("SELECT * FROM league_stats").fetchone()
+    if row is None:
+        rebuild()
+        row = to.cursor.execute("SELECT * FROM league_stats").fetchone()
+    return dict(zip([d[0] for d in to.cursor.description], row))
+
+
+def races_per_day():
+    """Return the average number of races per day that have been run."""
+    s = stats()
+    if s['races'] == 0:
+        return 0.01
+    days = s['last_race'] - s['first_race'] + 1
+    return s['races'] / days
+
+
+def race_life():
+    """Return the mean age (in days) at which horses have run their last race, and its
+    standard deviation."""
+    s = stats()
+    n = s['horses_raced']
+    if n == 0:
+        return math.nan, math.nan
+    if n == 1:
+        return s['race_life_mean'], math.nan
+    return s['race_life_mean'], math.sqrt(s['race_life_m2'] / (n - 1))
+
+
+def record_race(day, horse_ids):
+    """
+    Update the statistics with a race that has just been run.
+    Args:
+        day (datetime): Day of the race.
+        horse_ids (list): IDs of the horses that ran.
+
+    Returns:
+        None.
+    """
+    s = stats()
+    day = game_calendar.day_number(day)
+    horse_ids = [int(h) for h in horse_ids]
+    query = f"""
+    SELECT h.horse_id, ? - h.birth_date, l.age
+    FROM horses h LEFT JOIN last_races l ON l.horse_id = h.horse_id
+    WHERE h.horse_id IN {to.qmark_list(len(horse_ids))}
+    """
+    rows = to.cursor.execute(query, [day] + horse_ids).fetchall()
+
+    n, mean, m2 = s['horses_raced'], s['race_life_mean'], s['race_life_m2']
+    for _, age, previous in rows:
+        if previous is not None:
+            n, mean, m2 = _welford_remove(n, mean, m2, previous)
+        n, mean, m2 = _welford_add(n, mean, m2, age)
+
+    to.cursor.executemany("INSERT OR REPLACE INTO last_races (horse_id, age) VALUES (?, ?)",
+                          [(horse_id, age) for horse_id, age, _ in rows])
+    to.cursor.execute("""
+    UPDATE league_stats SET
+        races = races + 1,
+        first_race = IFNULL(first_race, ?),
+        last_race = ?,
+        horses_raced = ?,
+        race_life_mean = ?,
+        race_life_m2 = ?""", [day, day, n, mean, m2])
+    to.db.commit()
+
+
+def rebuild():
+    """Recalculate the statistics from scratch using every race that has been run."""
+    # The first and last races are the first and last run, not the earliest and latest dated
+    races, first, last = to.cursor.execute("""
+    SELECT COUNT(*),
+        (SELECT date FROM races ORDER BY race_id LIMIT 1),
+        (SELECT date FROM races ORDER BY race_id DESC LIMIT 1)
+    FROM races""").fetchone()
+    query = """
+    SELECT rr.horse_id, r.date - h.birth_date AS age
+    FROM all_race_results rr
+        INNER JOIN (SELECT MAX(result_id) AS result_id FROM all_race_results GROUP BY horse_id) latest
+            ON latest.result_id = rr.result_id
+        INNER JOIN races r ON r.race_id = rr.race_id
+        INNER JOIN all_horses h ON h.horse_id = rr.horse_id
+    """
+    to.cursor.execute("DELETE FROM league_stats")
+    to.cursor.execute("DELETE FROM last_races")
+    n, mean, m2 = 0, 0., 0.
+    for chunk in to.query_chunks(query):
+        ages = chunk['age']
+        n, mean, m2 = _welford_merge(n, mean, m2, len(ages), ages.mean(), ((ages - ages.mean())**2).sum())
+        to.insert_rows('last_races', {'horse_id': chunk['horse_id'].values,
+                                      'age': ages.values}, commit=False)
+
+    to.cursor.execute("INSERT INTO league_stats VALUES (?, ?, ?, ?, ?, ?)",
+                      [races, first, last, n, float(mean), float(m2)])
+    to.db.commit()
+
+
+def check():
+    """Check that the number of races in the statistics matches the races table.
+    Raises ValueError if it doesn't."""
+    counted = to.cursor.execute("SELECT COUNT(*) FROM races").fetchone()[0]
+    recorded = stats()['races']
+    if recorded != counted:
+        raise ValueError(f"The league statistics have {recorded} races, but {counted} have been run.")
+
+
+def _welford_add(n, mean, m2, x):
+    n += 1
+    delta = x - mean
+    mean += delta / n
+    return n, mean, m2 + delta * (x - mean)
+
+
+def _welford_merge(n, mean, m2, n_other, mean_other, m2_other):
+    """Combine the running totals of two groups of values (Chan et al.)."""
+    if n == 0:
+        return n_other, mean_other, m2_other
+    total = n + n_other
+    delta = mean_other - mean
+    return total, mean + delta * n_other / total, m2 + m2_other + delta**2 * n * n_other / total
+
+
+def _welford_remove(n, mean, m2, x):
+    if n <= 1:
+        return 0, 0., 0.
+    n -= 1
+    delta = x - mean
+    mean -= delta / n
+    return n, mean, m2 - delta * (x - mean)
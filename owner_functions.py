@@ -1,11 +1,12 @@
-import random
 import json
 import os
 import pandas as pd
 import phenotype as phe
 import table_operations
 import horse_functions
-import race_functions
+import random_context
+import entity_cache
+import valuation
 from game_parameters.constants import *
 
 
@@ -30,15 +31,44 @@ def pick_race_horses(owner_id, number):
     Return:
         List. horse_ids to put in a race.
     """
-    owner_id = int(owner_id)
-    horses = horse_functions.raceable_horses(owner_id)
-    if len(horses) == 0:
+    return pick_race_entrants({owner_id: number})
+
+
+def pick_race_entrants(numbers):
+    """Pick horses from several owners to put in a race (see pick_race_horses).
+
+    All of the owners' picks are made with one query. Each owner's raceable horses are
+    found through the raceable_horses index on the horses table and ranked by speed.
+
+    Args:
+        numbers (dict): owner_id, number of horses to pick from that owner pairs.
+
+    Return:
+        List. horse_ids to put in a race, grouped by owner in the order of numbers.
+    """
+    numbers = {int(o): int(n) for o, n in numbers.items() if n > 0}
+    if len(numbers) == 0:
         return []
-    query = f"SELECT horse_id, speed FROM horse_properties WHERE" \
-        f" horse_id in {table_operations.qmark_list(len(horses))}"
-    speeds = table_operations.query_to_dataframe(query, horses)
-    speeds.sort_values(by='speed', inplace=True)
-    return list(speeds.iloc[:min(number, len(speeds))]['horse_id'].values)
+    query = f"""
+    WITH wanted (owner_id, number) AS (VALUES {', '.join(['(?, ?)'] * len(numbers))})
+    SELECT horse_id, owner_id FROM (
+        SELECT
+            h.horse_id,
+            h.owner_id,
+            w.number,
+            ROW_NUMBER() OVER (PARTITION BY h.owner_id ORDER BY p.speed, h.horse_id) AS pick
+        FROM wanted w
+        INNER JOIN horses h ON h.owner_id = w.owner_id
+        INNER JOIN horse_properties p ON p.horse_id = h.horse_id
+        WHERE h.death_date IS NULL
+            AND h.leg_damage + h.heart_damage + h.ankle_damage < ?)
+    WHERE pick <= number
+    ORDER BY owner_id, pick"""
+    params = [x for pair in numbers.items() for x in pair] + [HEALTH_CUTOFF]
+    picks = {o: [] for o in numbers}
+    for horse_id, owner_id in table_operations.cursor.execute(query, params):
+        picks[owner_id].append(horse_id)
+    return [h for o in numbers for h in picks[o]]
 
 
 def horses_of(owner_id):
@@ -70,6 +100,25 @@ def add_money(owner_id, amount):
     table_operations.update_value('owners', command)
 
 
+def add_money_to_owners(amounts):
+    """Add money to the accounts of several owners with a single statement.
+
+    Args:
+        amounts (dict): owner_id, amount of money to add to that owner pairs.
+
+    Return:
+        None
+    """
+    if len(amounts) == 0:
+        return
+    owners = [int(o) for o in amounts]
+    command = f"UPDATE owners SET money = money + CASE owner_id {' '.join(['WHEN ? THEN ?'] * len(owners))}" \
+        f" END WHERE owner_id IN {table_operations.qmark_list(len(owners))}"
+    params = [x for o, amount in zip(owners, amounts.values()) for x in (o, amount)] + owners
+    table_operations.cursor.execute(command, params)
+    table_operations.db.commit()
+
+
 def remove_money(owner_id, amount):
     """Remove the specified amount from an owner's account. Will raise an error if the
     owner has less than that amount to remove.
@@ -94,20 +143,22 @@ def remove_money(owner_id, amount):
     table_operations.cursor.execute(command, [amount, owner_id])
 
 
-def add_owner(money=0., name=None):
+def add_owner(money=0., name=None, rng=None):
     """Create a new owner with the specified amount of money.
 
     Args:
         money (float): How much money the new owner has.
         name (str, None): Name to give to the owner. If None, will use a random name.
+        rng (RandomContext or None): Source of randomness. If None, uses the default.
 
     Return:
         int. The owner_id of the new owner.
 
     """
     if name is None:
-        name = random.choice(OWNER_NAMES)
+        name = str(random_context.resolve(rng).owners.choice(OWNER_NAMES))
     new_id = table_operations.insert_into_table('owners', {'money': money, 'name': name})
+    entity_cache.forget('owners', [new_id])
     return new_id
 
 
@@ -145,7 +196,8 @@ def horse_value(horse_id, day):
     """Return the estimated value of a horse.
 
     Currently the value is purely based on the number of races the horse could be
-    expected to run and how much they are expected to earn per race.
+    expected to run and how much they are expected to earn per race. See valuation for
+    valuing many horses at once.
 
     Args:
         horse_id (int): ID of the horse to evaluate.
@@ -154,13 +206,7 @@ def horse_value(horse_id, day):
     Returns:
         float. How many dollars the horse is estimated to be worth.
     """
-    current_age = horse_functions.age(horse_id, day).loc[0, 'age']
-    max_age, _ = horse_functions.expected_race_life()
-    remaining_life = max(0, max_age - current_age)
-
-    expected_races = remaining_life/race_functions.races_per_day()
-    expected_races = min(20, expected_races)
-    return expected_races * horse_functions.expected_winnings(horse_id)
+    return valuation.horse_value(horse_id, day)
 
 
 def evaluate_trade(owner_id, horse_id, amount, date, buy=True):
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import functools
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+
+"""
+Phase profiler
+
+Opt-in timing of the phases of the day loop (Game.run_days and Game.generate_history).
+Give a game a profiler and every call to one of its phases (delivering foals, racing,
+paying employees, etc.) is timed and put down to the in-game year it happened in, along
+with counts of the horses born, died and raced:
+
+    game.profiler = phase_profiler.PhaseProfiler()
+    game.run_days(20 * 365)
+    game.profiler.summary()    # calls, total and spread of times for each phase
+    game.profiler.by_year()    # seconds spent in each phase in each game year
+    game.profiler.histograms() # distribution of the call times of each phase
+
+When a long game slows down, by_year shows which phase grew. Phases can be nested (e.g. a
+race settles the accrued care first), in which case the outer phase includes the time of
+the inner one.
+
+If the profiler is given a sink, everything recorded is written to it at the end of each
+run_days or generate_history: a .csv sink gets one row per call (appended), and a .json
+sink is overwritten with the summary, per year breakdown and counts.
+"""
+
+# Edges (in seconds) of the histogram bins. Shared by all phases so they can be compared.
+HISTOGRAM_BINS = np.logspace(-6, 2, 33)
+
+
+class PhaseProfiler:
+    """Times the phases of the day loop and counts the horses born, died and raced.
+
+    Attributes:
+        records (list): (game year, phase, seconds) of every call timed.
+        counts (dict): (game year, counter) -> total. e.g. (2005, 'born') -> 120
+        sink (str or None): .csv or .json file to write to when flushed.
+    """
+
+    def __init__(self, sink=None):
+        """
+        Args:
+            sink (str or None): .csv or .json file to write the results to whenever the
+                profiler is flushed. If None, results are only kept in memory.
+        """
+        if sink is not None and os.path.splitext(sink)[1] not in ('.csv', '.json'):
+            raise ValueError(f"The sink must be a .csv or .json file, not {sink}.")
+        self.sink = sink
+        self.records = []
+        self.counts = defaultdict(int)
+        self._flushed = 0  # number of records already written to a csv sink
+
+    def reset(self):
+        """Forget everything that has been recorded."""
+        self.records = []
+        self.counts = defaultdict(int)
+        self._flushed = 0
+
+    @contextmanager
+    def phase(self, name, day):
+        """
+        Time the code run inside the context.
+        Args:
+            name (str): Name of the phase.
+            day (datetime): Current day in the game.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append((day.year, name, time.perf_counter() - start))
+
+    def count(self, name, number, day):
+        """Add number to the counter name (e.g. 'born') for the current game year."""
+        self.counts[(day.year, name)] += number
+
+    def dataframe(self):
+        """Return every call timed as a DataFrame with the columns year, phase and seconds."""
+        return pd.DataFrame(self.records, columns=['year', 'phase', 'seconds'])
+
+    def summary(self):
+        """
+        Return the number of calls, total time and spread of call times of each phase.
+
+        Returns:
+            pd.DataFrame. Index is the phase. Times are in seconds. Sorted by total time.
+        """
+        seconds = self.dataframe().groupby('phase')['seconds']
+        summary = pd.DataFrame({'calls': seconds.count(), 'total': seconds.sum(),
+                                'mean': seconds.mean(), 'median': seconds.median(),
+                                'p95': seconds.quantile(0.95), 'max': seconds.max()})
+        return summary.sort_values('total', ascending=False)
+
+    def by_year(self, statistic='sum'):
+        """
+        Return a statistic of the call times of each phase in each game year.
+        Args:
+            statistic (str): Any pandas aggregation, e.g. 'sum', 'mean' or 'count'.
+
+        Returns:
+            pd.DataFrame. Index is the game year and there is a column for each phase.
+        """
+        data = self.dataframe()
+        return data.pivot_table(index='year', columns='phase', values='seconds',
+                                aggfunc=statistic, fill_value=0)
+
+    def counts_by_year(self):
+        """Return the number of horses born, died and raced in each game year."""
+        counts = pd.Series(self.counts, dtype=int)
+        if len(counts) == 0:
+            return pd.DataFrame()
+        return counts.unstack(fill_value=0).rename_axis(index='year')
+
+    def histogram(self, phase, bins=HISTOGRAM_BINS):
+        """
+        Return the distribution of the call times of a phase.
+        Args:
+            phase (str): Name of the phase.
+            bins (np.array or int): Bin edges (in seconds), or the number of bins to use.
+
+        Returns:
+            np.array. Number of calls in each bin.
+            np.array. The bin edges.
+        """
+        seconds = [s for _, p, s in self.records if p == phase]
+        return np.histogram(seconds, bins=bins)
+
+    def histograms(self, bins=HISTOGRAM_BINS):
+        """Return a dict of phase -> histogram (see histogram) for every phase timed."""
+        return {phase: self.histogram(phase, bins) for phase in sorted({p for _, p, _ in self.records})}
+
+    def flush(self):
+        """Write the results to the sink (if there is one)."""
+        if self.sink is None:
+            return
+        if self.sink.endswith('.csv'):
+            new = self.dataframe().iloc[self._flushed:]
+            new.to_csv(self.sink, mode='a', index=False, header=not os.path.exists(self.sink))
+            self._flushed = len(self.records)
+        else:
+            output = {'summary': self.summary().to_dict(orient='index'),
+                      'by_year': self.by_year().to_dict(orient='index'),
+                      'counts': self.counts_by_year().to_dict(orient='index'),
+                      'histogram_bins': HISTOGRAM_BINS.tolist(),
+                      'histograms': {p: h.tolist() for p, (h, _) in self.histograms().items()}}
+            with open(self.sink, 'w') as f:
+                json.dump(output, f, indent=2, default=float)
+
+
+def phase(name):
+    """Decorate a method of Game so that it is timed as the phase name whenever the game
+    has a profiler."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(game, *args, **kwargs):
+            if game.profiler is None:
+                return method(game, *args, **kwargs)
+            with game.profiler.phase(name, game.day):
+                return method(game, *args, **kwargs)
+        return wrapper
+    return decorator
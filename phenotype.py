@@ -3,7 +3,9 @@ import numpy as np
 import pandas as pd
 import recalc_phenotype_funcs as recalc
 import fixed_phenotype_funcs as fixed
+import coat_table
 import table_operations as to
+import game_calendar
 from game_parameters.constants import *
 
 """
@@ -54,6 +56,9 @@ to_recalc = [x for x in getmembers(recalc) if isfunction(x[1])]
 
 to_fix = [x for x in getmembers(fixed) if isfunction(x[1])]
 
+# Fixed properties which can be calculated for many horses at once
+to_fix_batch = {'base_color': coat_table.base_colors, 'coat_pattern': coat_table.coat_patterns}
+
 
 def calc_properties(horse_id):
     """(Re)calculate the properties of a horse and store these results."""
@@ -77,6 +82,26 @@ def calc_properties(horse_id):
         to.update_table('horse_properties', new_data, horse_id)
 
 
+def calc_properties_bulk(horse_ids, dna1, dna2):
+    """Calculate and store the properties of many new horses at once.
+
+    Args:
+        horse_ids (list): IDs of the horses. None of them can have properties stored yet.
+        dna1 (list): First chromosome of each horse.
+        dna2 (list): Second chromosome of each horse.
+
+    Returns:
+        None
+    """
+    new_data = {'horse_id': horse_ids}
+    for k, v in to_recalc + to_fix:
+        if k in to_fix_batch:
+            new_data[k] = to_fix_batch[k](dna1, dna2)
+        else:
+            new_data[k] = [v(c1, c2) for c1, c2 in zip(dna1, dna2)]
+    to.insert_rows('horse_properties', new_data)
+
+
 def update_properties(dead_too=False):
     """Recalculate the properties of all horses and update the table.
 
@@ -86,13 +111,24 @@ def update_properties(dead_too=False):
     Returns:
         None
     """
-    if dead_too:
-        query = "SELECT horse_id FROM horses"
-    else:
-        query = "SELECT horse_id FROM horses WHERE death_date is Null"
-    horses = to.query_to_dataframe(query)
-    for h in horses['horse_id']:
-        calc_properties(h)
+    query = """
+    SELECT h.horse_id, h.dna1, h.dna2, p.horse_id IS NOT NULL AS stored
+    FROM horses h LEFT JOIN horse_properties p ON p.horse_id = h.horse_id
+    """
+    if not dead_too:
+        query += " WHERE h.death_date is Null"
+    columns = [k for k, _ in to_recalc]
+    update = f"UPDATE horse_properties SET {', '.join(f'{k} = ?' for k in columns)} WHERE horse_id = ?"
+    # The horses are read a chunk at a time, so the memory needed doesn't grow with the herd
+    for chunk in to.query_chunks(query, records=True):
+        stored = chunk['stored'] == 1
+        dna = list(zip(chunk['dna1'][stored], chunk['dna2'][stored]))
+        values = [[v(dna1, dna2) for dna1, dna2 in dna] for _, v in to_recalc]
+        to.cursor.executemany(update, zip(*values, [int(h) for h in chunk['horse_id'][stored]]))
+        # Horses without any properties yet get the fixed ones too
+        if (~stored).any():
+            calc_properties_bulk([int(h) for h in chunk['horse_id'][~stored]],
+                                 list(chunk['dna1'][~stored]), list(chunk['dna2'][~stored]))
 
 
 def h_prop(property, horse_id, day=None):
@@ -122,8 +158,8 @@ def h_prop(property, horse_id, day=None):
     # If there is no need to update, and we have the data
     if data is not None:
         if day is None:
-            day = data['last_updated']
-        day_diff = (pd.to_datetime(day) - data['last_updated']).days
+            day = game_calendar.from_day_number(data['last_updated'])
+        day_diff = game_calendar.day_number(day) - data['last_updated']
         if day_diff < PROPERTY_UPDATE:
             return data[property]
 
@@ -136,7 +172,7 @@ def h_prop(property, horse_id, day=None):
             return getattr(fixed, property)(dna1, dna2)
 
     # If we need to update or add data
-    new_data = {'last_updated': day}
+    new_data = {'last_updated': game_calendar.day_number(day)}
     for k, v in to_recalc:
         new_data[k] = v(dna1, dna2)
 
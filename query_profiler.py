@@ -0,0 +1,255 @@
+import re
+import sys
+import time
+import sqlite3
+from functools import lru_cache
+import pandas as pd
+
+"""
+SQL query profiler
+
+An opt-in tracer for finding out which of the many queries run each day come from where.
+table_operations opens its connections with ProfiledConnection. While the profiler is
+switched off this only costs a flag check per call. Once it is switched on:
+
+    - Every statement that SQLite runs is seen by a trace callback (set_trace_callback),
+      so the statements run by pandas and executemany are counted too.
+    - execute, executemany and the fetch methods of the cursors are timed and the rows
+      they return (or change) are counted.
+    - Each statement is put down to the first function outside of table_operations,
+      pandas and sqlite3 in the call stack (e.g. horse_functions.pedigree), and grouped
+      by its shape: the statement with its literal values replaced by '?' and any IN
+      lists collapsed, so that 'WHERE horse_id IN (3, 4)' and 'WHERE horse_id IN (7)'
+      are counted together.
+
+A statement which is run once for every horse (an N+1 pattern) shows up as one shape
+with a huge count coming from one function.
+
+    import query_profiler
+    query_profiler.enable()
+    game.run_days(30)         # run_days dumps the report when it finishes
+    query_profiler.report()   # or get it as a DataFrame
+"""
+
+# Modules that run queries on behalf of others. Statements are put down to whatever called them.
+PASS_THROUGH_MODULES = ('query_profiler', 'table_operations', 'pandas', 'sqlite3', 'sqlalchemy',
+                        'contextlib')
+
+
+class QueryProfiler:
+    """Collects the count, time and rows of every statement, grouped by caller and shape.
+
+    Attributes:
+        enabled (bool): If False, nothing is recorded.
+        output (str or None): CSV file to write the full report to whenever it is dumped.
+        stats (dict): (caller, shape) -> [statements run, seconds, rows].
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.output = None
+        self.stats = {}
+        self._caller = None  # caller of the statement currently being executed
+
+    def reset(self):
+        """Forget everything that has been recorded."""
+        self.stats = {}
+
+    def trace(self, statement):
+        """Trace callback for the connection. Called by SQLite for every statement run."""
+        caller = self._caller or find_caller()
+        self._entry(caller, statement)[0] += 1
+
+    def record(self, caller, statement, seconds, rows):
+        """Add time and rows to the statement."""
+        entry = self._entry(caller, statement)
+        entry[1] += seconds
+        entry[2] += max(rows, 0)
+
+    def _entry(self, caller, statement):
+        key = (caller, normalize(statement))
+        entry = self.stats.get(key)
+        if entry is None:
+            entry = self.stats[key] = [0, 0., 0]
+        return entry
+
+
+PROFILER = QueryProfiler()
+
+
+@lru_cache(maxsize=4096)
+def normalize(statement):
+    """
+    Return the shape of a statement: its literal values replaced by '?', lists of values
+    collapsed to '(...)' and all whitespace reduced to single spaces.
+    Args:
+        statement (str): SQL statement.
+
+    Returns:
+        str.
+    """
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?\b", '?', shape)
+    shape = re.sub(r"\s+", ' ', shape).strip()
+    shape = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*,?\s*\)", '(...)', shape)
+    return shape
+
+
+def find_caller():
+    """Return 'module.function' of the first frame outside of the PASS_THROUGH_MODULES."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(PASS_THROUGH_MODULES):
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return 'unknown'
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """A cursor that times its statements and counts its rows while the profiler is on."""
+
+    def execute(self, sql, parameters=()):
+        if not PROFILER.enabled:
+            return super().execute(sql, parameters)
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not PROFILER.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        if not PROFILER.enabled:
+            return super().fetchone()
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        if not PROFILER.enabled:
+            return super().fetchmany(size or self.arraysize)
+        return self._fetch(lambda: super(ProfiledCursor, self).fetchmany(size or self.arraysize))
+
+    def fetchall(self):
+        if not PROFILER.enabled:
+            return super().fetchall()
+        return self._fetch(super().fetchall)
+
+    def __next__(self):
+        if not PROFILER.enabled:
+            return super().__next__()
+        return self._fetch(super().__next__)
+
+    def _timed(self, method, sql, parameters):
+        """Run execute or executemany, recording the time and the rows changed."""
+        self._profile_key = (find_caller(), sql)
+        PROFILER._caller = self._profile_key[0]
+        start = time.perf_counter()
+        try:
+            return method(sql, parameters)
+        finally:
+            PROFILER._caller = None
+            PROFILER.record(*self._profile_key, time.perf_counter() - start, self.rowcount)
+
+    def _fetch(self, method):
+        """Fetch rows, putting the time and the number of rows down to the last statement."""
+        start = time.perf_counter()
+        rows = method()
+        key = getattr(self, '_profile_key', None)
+        if key is not None:
+            if rows is None:
+                number = 0
+            elif isinstance(rows, list):
+                number = len(rows)
+            else:
+                number = 1
+            PROFILER.record(*key, time.perf_counter() - start, number)
+        return rows
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """A connection whose cursors are ProfiledCursors and whose commits are timed."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if PROFILER.enabled:
+            self.set_trace_callback(PROFILER.trace)
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not PROFILER.enabled:
+            return super().commit()
+        caller = find_caller()
+        PROFILER._caller = caller
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            PROFILER._caller = None
+            PROFILER.record(caller, 'COMMIT', time.perf_counter() - start, 0)
+
+
+def enable(output=None, reset=True):
+    """
+    Start profiling the queries run on the active database.
+    Args:
+        output (str or None): CSV file to write the full report to whenever it is dumped.
+        reset (bool): If True, forget anything recorded before.
+    """
+    import table_operations
+    if reset:
+        PROFILER.reset()
+    PROFILER.output = output
+    PROFILER.enabled = True
+    table_operations.db.set_trace_callback(PROFILER.trace)
+
+
+def disable():
+    """Stop profiling. What has been recorded is kept until the next reset."""
+    import table_operations
+    PROFILER.enabled = False
+    table_operations.db.set_trace_callback(None)
+
+
+def report(by='statement'):
+    """
+    Return what has been recorded.
+    Args:
+        by (str): 'statement' for one row per caller and statement shape, 'caller' for one
+            row per calling function or 'module' for one row per calling module.
+
+    Returns:
+        pd.DataFrame. Columns count, seconds, rows and ms_per_statement, sorted by seconds.
+    """
+    data = pd.DataFrame([(caller, shape, *entry) for (caller, shape), entry in PROFILER.stats.items()],
+                        columns=['caller', 'statement', 'count', 'seconds', 'rows'])
+    data['module'] = data['caller'].str.rsplit('.', n=1).str[0]
+    if by == 'statement':
+        data = data.set_index(['caller', 'statement']).drop(columns='module')
+    else:
+        data = data.groupby(by)[['count', 'seconds', 'rows']].sum()
+    data['ms_per_statement'] = 1000 * data['seconds'] / data['count'].clip(lower=1)
+    return data.sort_values('seconds', ascending=False)
+
+
+def dump(top=20):
+    """Print the top of the report (and write all of it to the output file, if there is one)."""
+    if not PROFILER.stats:
+        return
+    statements = report()
+    if PROFILER.output is not None:
+        statements.to_csv(PROFILER.output)
+    total = statements[['count', 'seconds', 'rows']].sum()
+    top_statements = statements.head(top).reset_index()
+    top_statements['statement'] = top_statements['statement'].str.slice(0, 80)
+    print(f"\n{int(total['count'])} statements taking {total['seconds']:.2f} s "
+          f"and returning {int(total['rows'])} rows")
+    print(report(by='module').to_string(float_format='{:.3f}'.format))
+    print(top_statements.to_string(index=False, float_format='{:.3f}'.format))
@@ -2,6 +2,8 @@ import datetime
 import json
 import numpy as np
 import table_operations as to
+import league_stats
+import game_calendar
 
 
 def add_race(start_time, distance, purse):
@@ -15,7 +17,8 @@ def add_race(start_time, distance, purse):
     Returns:
           int. ID of the race.
     """
-    params = {'date': start_time, 'distance': distance, 'total_purse': sum(purse)}
+    params = {'date': game_calendar.day_number(start_time), 'distance': distance,
+              'total_purse': sum(purse)}
     new_id = to.insert_into_table('races', params)
     return new_id
 
@@ -23,9 +26,4 @@ def add_race(start_time, distance, purse):
 def races_per_day():
     """Return the average number of races per day that have been run.
     """
-
-    races = to.query_to_dataframe("SELECT date FROM races")
-    if len(races) == 0:
-        return 0.01
-    return len(races)/\
-           ((races['date'].values[-1] - races['date'].values[0])/np.timedelta64(1, 'D')+1)
+    return league_stats.races_per_day()
@@ -0,0 +1,58 @@
+import numpy as np
+
+"""
+Random numbers
+
+All of the randomness in the simulation is drawn from a RandomContext. A context holds one
+numpy Generator per subsystem (its streams), all spawned from a single seed. Giving each
+subsystem its own stream means that, for instance, an extra draw when naming a foal does
+not shift the numbers used to run every later race. Two games given the same seed will
+make exactly the same choices and so write exactly the same databases.
+
+The Game owns a context and passes it to the functions it calls. Functions which are
+called without one (e.g. from the gui or a script) fall back on DEFAULT, which is seeded
+randomly.
+
+Note that genetics.apply_hash is deterministic (md5) and is not a source of randomness.
+"""
+
+# New streams go at the end, so that the streams before them are spawned the same as before
+STREAMS = ('genetics', 'horses', 'employees', 'owners', 'races', 'game', 'names')
+
+
+class RandomContext:
+    """Holds a separate random number generator for each subsystem of the simulation.
+
+    Attributes:
+        seed (int): Seed that all of the streams were spawned from.
+        genetics (np.random.Generator): Chromosome creation, mixing and mutation.
+        horses (np.random.Generator): Births, lifespans, pregnancies and injuries.
+        employees (np.random.Generator): Generating employees.
+        owners (np.random.Generator): Owner names and the AI owners' decisions.
+        races (np.random.Generator): When races happen, who runs and how fast.
+        game (np.random.Generator): Everything else decided by the game loop.
+        names (np.random.Generator): Names offered for foals (which the player may
+            redraw as often as they like).
+    """
+
+    def __init__(self, seed=None):
+        """
+        Args:
+            seed (int or None): Seed for all of the streams. If None, a random seed is used.
+        """
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy % 2**63)
+        self.seed = seed
+        children = np.random.SeedSequence(seed).spawn(len(STREAMS))
+        for name, child in zip(STREAMS, children):
+            setattr(self, name, np.random.default_rng(child))
+
+
+def resolve(rng):
+    """Return the provided context, or the default context if it is None."""
+    if rng is None:
+        return DEFAULT
+    return rng
+
+
+DEFAULT = RandomContext()
@@ -0,0 +1,142 @@
+import time
+import traceback
+from PyQt5 import QtCore
+import table_operations as to
+import owner_functions as of
+import game_loop
+from text_operations import convert_to_links
+
+"""
+Simulation thread
+
+Runs the long parts of the game (run_days over many days, generate_history) on a QThread
+so that the window stays responsive, and lets the player stop them part way through.
+
+While a SimulationWorker runs a job it stands in for the game's gui (it has the methods of
+BasicPrinter). Nothing it is told is drawn straight away: the day, the money and the
+messages are buffered and sent to the GUI thread together, at most every UPDATE_INTERVAL
+seconds, by the updated signal. Messages are turned into links in the simulation thread,
+since that needs the database, and only once they are sent. If the GUI can only show the
+latest max_messages, the older messages are dropped without being converted.
+
+There is only one database connection, so the GUI thread must leave the database alone
+while a job runs (MainScreen disables everything that reads it). The exception is the
+prompts for the player (joining a race and naming a foal): the simulation thread asks for
+them with signals connected by a BlockingQueuedConnection, so it waits, without touching
+the database, until the GUI thread has finished handling them. Once a job has been asked to
+stop the player isn't prompted any more, so stopping never waits on the GUI thread.
+
+    worker = SimulationWorker(game, game.run_days, 365, fast_forward=True)
+    worker.moveToThread(thread)
+    thread.started.connect(worker.run)
+"""
+
+UPDATE_INTERVAL = 0.1  # Seconds between the updates sent to the GUI
+
+
+class SimulationWorker(QtCore.QObject):
+    """Runs a job of a game in whichever thread it is moved to.
+
+    Signals:
+        progress (int, int): Days done and days to do.
+        updated (list, object, object): (day, html) of each new message, the current day
+            and the player's money (None if unchanged).
+        join_race_requested: The player is invited to the upcoming race. The handler
+            should only return once the race has been run or declined.
+        name_requested (str, str): A foal of the player has been born to the named mother
+            with the given gender. The handler should set name to the foal's name.
+        finished: The job is over (whether it completed, was stopped or failed).
+        failed (str): The job raised an exception. Sent with the traceback.
+    """
+    progress = QtCore.pyqtSignal(int, int)
+    updated = QtCore.pyqtSignal(list, object, object)
+    join_race_requested = QtCore.pyqtSignal()
+    name_requested = QtCore.pyqtSignal(str, str)
+    finished = QtCore.pyqtSignal()
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, game, job, *args, **kwargs):
+        """
+        Args:
+            game (Game): Game to run the job for.
+            job (callable): e.g. game.run_days.
+            *args, **kwargs: Arguments for the job.
+        """
+        super(SimulationWorker, self).__init__()
+        self.game = game
+        self.job = job
+        self.args = args
+        self.kwargs = kwargs
+        self.name = None  # Set by the handler of name_requested
+        self.max_messages = None  # Only the latest messages are sent, if set
+
+        self._messages = []
+        self._day = None
+        self._money_changed = False
+        self._days = None
+        self._last_update = 0.
+        self._stopping = False
+
+    def run(self):
+        """Run the job. Connect to the started signal of the thread the worker was moved to."""
+        gui, self.game.gui = self.game.gui, self
+        self.game.progress = self._progress
+        try:
+            # Stopped before it started (the job itself forgets stops from before it began)
+            if not self._stopping:
+                self.job(*self.args, **self.kwargs)
+        except Exception:
+            self.failed.emit(traceback.format_exc())
+        finally:
+            to.db.commit()
+            self._send_update()
+            self.game.gui = gui
+            self.game.progress = None
+            self.finished.emit()
+
+    def stop(self):
+        """Ask the job to stop at the end of the current day. The player isn't asked
+        anything after that: races go ahead without them and foals keep random names."""
+        self._stopping = True
+        self.game.stop()
+
+    def _progress(self, done, total):
+        self._days = done, total
+        if time.monotonic() - self._last_update >= UPDATE_INTERVAL:
+            self._send_update()
+
+    def _send_update(self):
+        """Send everything buffered since the last update to the GUI thread."""
+        self._last_update = time.monotonic()
+        if self._days is not None:
+            self.progress.emit(*self._days)
+        money = of.money(self.game.owner) if self._money_changed else None
+        messages, self._messages = self._messages[-(self.max_messages or 0):], []
+        self.updated.emit([(day, convert_to_links(msg)) for day, msg in messages], self._day, money)
+        self._money_changed = False
+
+    # The methods of the game's gui
+
+    def display_message(self, msg):
+        self._messages.append((self.game.day, msg))
+
+    def update_day(self, date):
+        self._day = date
+
+    def update_money(self):
+        self._money_changed = True
+
+    def ask_to_join_race(self):
+        if self._stopping:
+            return game_loop.HeadlessPrinter(self.game).ask_to_join_race()
+        self._send_update()
+        self.join_race_requested.emit()
+        return []
+
+    def ask_to_name_foal(self, mother, foal_gender):
+        if self._stopping:
+            return game_loop.HeadlessPrinter(self.game).ask_to_name_foal(mother, foal_gender)
+        self._send_update()
+        self.name = None
+        self.name_requested.emit(str(mother), str(foal_gender))
+        return self.name
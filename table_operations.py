@@ -8,37 +8,72 @@ import numpy as np
 import pandas as pd
 import recalc_phenotype_funcs
 import fixed_phenotype_funcs
+import query_profiler
 import game_parameters.constants as c
 
 folder = os.path.join(os.path.dirname(__file__), 'saves')
+# Dates are stored as day numbers, the number of days since DATE_EPOCH (see game_calendar)
 DATE_COLUMNS = ['birth_date', 'death_date', 'expected_death', 'due_date', 'date', 'last_updated']
+# The columns holding dates in each table, which saves from before day numbers store as text
+DATE_TABLES = {'horses': ['birth_date', 'death_date', 'expected_death', 'due_date'],
+               'archived_horses': ['birth_date', 'death_date', 'expected_death', 'due_date'],
+               'races': ['date'],
+               'calendar': ['date'],
+               'game_info': ['date'],
+               'league_stats': ['first_race', 'last_race']}
+CHUNK_SIZE = 10000  # Rows per chunk when a query is read a chunk at a time (see query_chunks)
+# Tables whose rows for long dead horses are moved to an archived_ copy (see archive.py).
+# The view all_<table> shows both.
+ARCHIVED_TABLES = ['horses', 'horse_properties', 'race_results']
 
 
 def load_save(save_name):
     """Set the active database to be a particular save."""
-    global db
     db.close()
 
     shutil.copyfile(os.path.join(folder, f"{save_name}"),
                     os.path.join(folder, f"active_game.db"))
 
-    db = sqlite3.connect(os.path.join(folder, f"active_game.db"))
-    global cursor
+    connect(os.path.join(folder, f"active_game.db"))
+
+
+def connect(path):
+    """
+    Use the database at path (creating it if needed) in place of the active database.
+    Any missing tables are created. This lets several games run at once, each in its
+    own process and database file.
+
+    The connection can be used from any thread (e.g. by the GUI's simulation thread), but
+    only by one thread at a time.
+    Args:
+        path (str): Location of the database file.
+
+    Returns:
+        None.
+    """
+    global db, cursor
+    db.close()
+    db = sqlite3.connect(path, factory=query_profiler.ProfiledConnection, check_same_thread=False)
     cursor = db.cursor()
     create_empty_tables(overwrite=False)
 
 
 def save_game(save_name):
     """
-    Save the active database to a stored database.
+    Save the active database to a stored database. The database connected to is copied,
+    whichever file it is (see connect).
     Args:
         save_name (str): The name of the stored database.
 
     Returns:
         None.
     """
-    shutil.copyfile(os.path.join(folder, f"active_game.db"),
-                    os.path.join(folder, f"{save_name}.db"))
+    db.commit()
+    saved = sqlite3.connect(os.path.join(folder, f"{save_name}.db"))
+    try:
+        db.backup(saved)
+    finally:
+        saved.close()
 
 
 def insert_into_table(table, data_dict):
@@ -68,6 +103,26 @@ def insert_into_table(table, data_dict):
     return cursor.lastrowid
 
 
+def insert_rows(table, data, commit=True):
+    """Insert many rows into an existing table with a single executemany.
+
+    Args:
+        table (str): Name of the table to add the rows to.
+        data (dict): Column, values pairs. Every column must have the same number of values.
+        commit (bool): If True, will commit once all of the rows are inserted.
+
+    Return:
+        Nothing.
+    """
+    columns = list(data.keys())
+    values = [np.asarray(v).tolist() if isinstance(v, np.ndarray) else list(v)
+              for v in data.values()]
+    command = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {qmark_list(len(columns))}"
+    cursor.executemany(command, zip(*values))
+    if commit:
+        db.commit()
+
+
 def update_table(table, data_dict, primary_key_val):
     """Update a table with the provided data.
     Args:
@@ -127,17 +182,29 @@ def qmark_list(number):
 
 
 def whole_table(table):
-    """Convert a table in the database into a pandas dataframe."""
+    """Convert a table in the database into a pandas dataframe. For tables that grow with the
+    length of the game, table_chunks uses less memory."""
     command = f"SELECT * from {table}"
     return query_to_dataframe(command)
 
 
+def table_chunks(table, chunk_size=CHUNK_SIZE, records=False, connection=None):
+    """Read a whole table a chunk at a time (see query_chunks)."""
+    return query_chunks(f"SELECT * FROM {table}", chunk_size=chunk_size, records=records,
+                        connection=connection)
+
+
 def primary_key(table):
     """Return the first primary key of the given table."""
     table_info = pd.read_sql_query(f'PRAGMA table_info({table})', db)
     return table_info.loc[table_info['pk'] == 1, 'name'].values[0]
 
 
+def column_names(table):
+    """Return the names of the columns of a table, in the order they are stored."""
+    return [col[1] for col in cursor.execute(f"PRAGMA table_info({table})")]
+
+
 def get_rows(table, ids):
     """Get rows from table with primary key in ids.
 
@@ -203,7 +270,39 @@ def update_value(table, command):
 
 def query_to_dataframe(query, params=[]):
     """Return the query as a pandas dataframe."""
-    return pd.read_sql_query(query, db, params=params, parse_dates=DATE_COLUMNS)
+    return pd.read_sql_query(query, db, params=params)
+
+
+def query_chunks(query, params=[], chunk_size=CHUNK_SIZE, records=False, connection=None):
+    """
+    Run a query and yield its result chunk_size rows at a time, so that only one chunk is
+    ever in memory. The query has its own cursor, so other queries can be run (e.g. to
+    store results) while the chunks are read.
+    Args:
+        query (str): SQL query.
+        params (list): Values for the placeholders in the query.
+        chunk_size (int): Maximum number of rows in each chunk.
+        records (bool): If True, chunks are NumPy record arrays. Otherwise they are
+            DataFrames.
+        connection (sqlite3.Connection or None): Database to read. If None, the active one.
+
+    Yields:
+        pd.DataFrame or np.recarray.
+    """
+    chunk_cursor = (db if connection is None else connection).cursor()
+    chunk_cursor.execute(query, params)
+    columns = [d[0] for d in chunk_cursor.description]
+    try:
+        while True:
+            rows = chunk_cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            if records:
+                yield np.rec.fromrecords(rows, names=columns)
+                continue
+            yield pd.DataFrame.from_records(rows, columns=columns)
+    finally:
+        chunk_cursor.close()
 
 
 def list_tables():
@@ -262,13 +361,13 @@ def create_empty_tables(overwrite=True):
     tables['horses'] = """
     CREATE TABLE IF NOT EXISTS horses (
         horse_id INTEGER PRIMARY KEY,
-        birth_date TEXT NOT NULL,
-        death_date TEXT DEFAULT NULL,
-        expected_death TEXT NOT NULL,
+        birth_date INTEGER NOT NULL,
+        death_date INTEGER DEFAULT NULL,
+        expected_death INTEGER NOT NULL,
         name TEXT NOT NULL,
         gender TEXT check(gender in ('M', 'F')),
         owner_id INTEGER,
-        due_date TEXT DEFAULT NULL,
+        due_date INTEGER DEFAULT NULL,
         impregnated_by INTEGER DEFAULT NULL,
         dam INTEGER DEFAULT NULL,
         sire INTEGER DEFAULT NULL,
@@ -291,7 +390,7 @@ def create_empty_tables(overwrite=True):
     tables['races'] = """
     CREATE TABLE IF NOT EXISTS races (
         race_id INTEGER PRIMARY KEY,
-        date TEXT NOT NULL,
+        date INTEGER NOT NULL,
         total_purse INTEGER DEFAULT 0,
         distance REAL NOT NULL
         )"""
@@ -331,7 +430,8 @@ def create_empty_tables(overwrite=True):
     cols = []
     for employee in c.EMPLOYEES.keys():
         cols += list(c.EMPLOYEES[employee]['bonuses'].keys())
-    for col in set(cols):
+    # Deduplicated in a fixed order so that the table layout never depends on hashing
+    for col in dict.fromkeys(cols):
         employee_table += f"{col} float DEFAULT 0,\n"
     employee_table += "FOREIGN KEY (employer) REFERENCES owners (owner_id))"
     tables['employees'] = employee_table
@@ -349,23 +449,136 @@ def create_empty_tables(overwrite=True):
 
     tables['game_info'] = """
     CREATE TABLE IF NOT EXISTS game_info (
-        date TEXT DEFAULT '2000-01-01',
+        date INTEGER DEFAULT 0,
         date_increment INTEGER DEFAULT 0)"""
 
     tables['calendar'] = """
     CREATE TABLE IF NOT EXISTS calendar (
-        date TEXT NOT NULL,
+        date INTEGER NOT NULL,
         name TEXT NOT NULL,
         type TEXT,
         PRIMARY KEY (date, name))
     """
 
+    # Living horses by owner and total damage, for finding the horses fit to race
+    indexes = {}
+    indexes['raceable_horses'] = """
+    CREATE INDEX IF NOT EXISTS raceable_horses
+    ON horses (owner_id, leg_damage + heart_damage + ankle_damage)
+    WHERE death_date IS NULL"""
+    # The race records of particular horses, for race summaries and valuations
+    indexes['race_results_horse'] = """
+    CREATE INDEX IF NOT EXISTS race_results_horse ON race_results (horse_id)"""
+
+    # Running totals kept by league_stats
+    tables['league_stats'] = """
+    CREATE TABLE IF NOT EXISTS league_stats (
+        races INTEGER DEFAULT 0,
+        first_race INTEGER DEFAULT NULL,
+        last_race INTEGER DEFAULT NULL,
+        horses_raced INTEGER DEFAULT 0,
+        race_life_mean REAL DEFAULT 0,
+        race_life_m2 REAL DEFAULT 0)"""
+
+    tables['last_races'] = """
+    CREATE TABLE IF NOT EXISTS last_races (
+        horse_id INTEGER PRIMARY KEY,
+        age REAL NOT NULL,
+        FOREIGN KEY (horse_id) REFERENCES horses (horse_id))"""
+
+    # Archived rows have the same columns as the rows still in use
+    for name in ARCHIVED_TABLES:
+        tables[f'archived_{name}'] = tables[name].replace(f'EXISTS {name} (', f'EXISTS archived_{name} (')
+    indexes['archived_race_results_horse'] = """
+    CREATE INDEX IF NOT EXISTS archived_race_results_horse ON archived_race_results (horse_id)"""
+
     if overwrite:
         delete_tables(tables.keys())
+    else:
+        migrate_dates(tables)
+        migrate_properties()
 
     for name, table in tables.items():
         print(f"Creating table {name}. ")
         cursor.execute(table)
+    for index in indexes.values():
+        cursor.execute(index)
+    create_archive_views()
+    db.commit()
+
+
+def create_archive_views():
+    """
+    (Re)create the views all_<table> of the archived tables. The columns are listed by name
+    rather than with *, since a table and its archived copy don't always have them in the
+    same order (e.g. when a column was added to an old save by migrate_properties).
+    """
+    for name in ARCHIVED_TABLES:
+        columns = ', '.join(column_names(name))
+        cursor.execute(f"DROP VIEW IF EXISTS all_{name}")
+        cursor.execute(f"CREATE VIEW all_{name} AS"
+                       f" SELECT {columns} FROM {name} UNION ALL SELECT {columns} FROM archived_{name}")
+
+
+def migrate_dates(tables):
+    """
+    Convert the dates of a save from before dates were stored as day numbers. SQLite can't
+    change the type of a column, so each table with text dates is copied into a new table
+    (converting the dates on the way) which then replaces it.
+    Args:
+        tables (dict): Name -> CREATE TABLE statement of the tables (see create_empty_tables).
+
+    Returns:
+        None.
+    """
+    for table, dates in DATE_TABLES.items():
+        columns = {col[1]: col[2].upper() for col in cursor.execute(f"PRAGMA table_info({table})")}
+        if not columns or columns.get(dates[0]) == 'INTEGER':
+            continue
+        print(f"Converting the dates of {table} to day numbers. ")
+        # The views are recreated by create_empty_tables
+        for name in ARCHIVED_TABLES:
+            cursor.execute(f"DROP VIEW IF EXISTS all_{name}")
+        cursor.execute(f"DROP TABLE IF EXISTS {table}_new")
+        cursor.execute(tables[table].replace(f'EXISTS {table} (', f'EXISTS {table}_new ('))
+        values = [day_number_sql(col) if col in dates else col for col in columns]
+        cursor.execute(f"INSERT INTO {table}_new ({', '.join(columns)})"
+                       f" SELECT {', '.join(values)} FROM {table}")
+        cursor.execute(f"DROP TABLE {table}")
+        cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    db.commit()
+
+
+def day_number_sql(column):
+    """Return SQL turning a text date in a column into its day number (see migrate_dates)."""
+    return f"CAST(round(julianday({column}) - julianday('{c.DATE_EPOCH}')) AS INTEGER)"
+
+
+def migrate_properties():
+    """
+    Add the columns of any properties added since a save was made to its horse_properties
+    tables, and fill them in for the horses the save already has (fixed properties are
+    never recalculated, and the game expects every horse to have the others).
+    """
+    properties = [x for x in getmembers(recalc_phenotype_funcs) if isfunction(x[1])] + \
+        [x for x in getmembers(fixed_phenotype_funcs) if isfunction(x[1])]
+    for table, horses in [('horse_properties', 'horses'), ('archived_horse_properties', 'archived_horses')]:
+        columns = [col[1] for col in cursor.execute(f"PRAGMA table_info({table})")]
+        missing = [(name, func) for name, func in properties if name not in columns]
+        if not columns or not missing:
+            continue
+        print(f"Adding {', '.join(name for name, _ in missing)} to {table}. ")
+        # The views are recreated by create_empty_tables
+        for name in ARCHIVED_TABLES:
+            cursor.execute(f"DROP VIEW IF EXISTS all_{name}")
+        for name, _ in missing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} float")
+
+        update = f"UPDATE {table} SET {', '.join(f'{name} = ?' for name, _ in missing)} WHERE horse_id = ?"
+        query = f"SELECT p.horse_id, h.dna1, h.dna2 FROM {table} p INNER JOIN {horses} h ON h.horse_id = p.horse_id"
+        for chunk in query_chunks(query, records=True):
+            values = [[func(dna1, dna2) for dna1, dna2 in zip(chunk['dna1'], chunk['dna2'])] for _, func in missing]
+            cursor.executemany(update, zip(*values, [int(h) for h in chunk['horse_id']]))
     db.commit()
 
 
@@ -380,6 +593,8 @@ def game_info_state():
     return data.iloc[0].to_dict()
 
 
-db = sqlite3.connect(os.path.join(folder, "active_game.db"))
+# Queries can be profiled with query_profiler.enable()
+db = sqlite3.connect(os.path.join(folder, "active_game.db"), factory=query_profiler.ProfiledConnection,
+                     check_same_thread=False)
 cursor = db.cursor()
 create_empty_tables(overwrite=False)
@@ -1,3 +1,45 @@
+import re
 import math
+import entity_cache
 
-ordinal = lambda n: "%d%s" % (n, "tsnrhtdd"[(n/10%10 != 1)*(n%10 < 4)*n%10::4])
\ No newline at end of file
+ordinal = lambda n: "%d%s" % (n, "tsnrhtdd"[(n/10%10 != 1)*(n%10 < 4)*n%10::4])
+
+
+def convert_to_links(msg):
+    """Convert a string containing link indicators so that it contains proper links.
+
+    To indicate a link in a string, use the form [TABLE_NAME:ID]. e.g. [horses:21] to
+    indicate a link to the horse with the ID 21. The names of everything linked to are
+    looked up together, with one query per table at most.
+    """
+    pattern = '\[[^\]]*]'
+    links = [link.strip('[]').split(':') for link in re.findall(pattern, msg)]
+    normal_text = re.split(pattern, msg)
+    ids = {}
+    for table, id_ in links:
+        ids.setdefault(table, []).append(int(id_))
+    names = {table: entity_cache.names(table, table_ids) for table, table_ids in ids.items()}
+
+    output = ''
+    for i, (table, id_) in enumerate(links):
+        output += normal_text[i]
+        output += format_link(table, int(id_), names[table][int(id_)])
+    output += normal_text[-1]
+    return output
+
+
+def format_link(table, id_, name=None):
+    """Create a string to use as a link in the GUI.
+
+    Args:
+        table (str): The type of thing to link to (horses, owners, etc.)
+        id_ (str or int): ID of the thing to link to.
+        name (str or None): Name to use as the hyperlink code. If None, will use the
+            name as stored in the database. If there is no column 'name', will
+            default to the id.
+    Returns:
+          str
+    """
+    if name is None:
+        name = entity_cache.name(table, id_)
+    return f"<a href=\"#{table}#{id_}\">{name}</a>"
@@ -1,6 +1,52 @@
 import genetics as ge
 
 
+def expressed_allele(gene_name, alleles):
+    """Return the allele code that a pair of alleles of a base color gene express.
+
+    Args:
+        gene_name (str): kit, extension, agouti, cream, dun, champagne, dapple or flaxen.
+        alleles (tuple): The allele of the gene on each chromosome.
+
+    Returns:
+        str. The code coat_color takes for the gene.
+    """
+    if gene_name == 'kit':
+        return 'W' if 'W' in alleles else 'w+'
+    if gene_name == 'agouti':
+        for allele in ('A+', 'A', 'At'):
+            if allele in alleles:
+                return allele
+        return 'a'
+    if gene_name == 'cream':
+        if 'Cr' in alleles and 'cr' not in alleles:
+            return 'CrCr'
+        elif 'Cr' in alleles:
+            return 'Cr'
+        elif 'prl' in alleles and 'cr' not in alleles:
+            return 'prl'
+        return 'cr'
+    # The other genes have one dominant allele
+    dominant = {'extension': 'E', 'dun': 'D', 'champagne': 'Ch', 'dapple': 'Z', 'flaxen': 'F'}[gene_name]
+    return dominant if dominant in alleles else ge.GENES[gene_name]['broken']
+
+
+def coat_color(kit, ext, agouti, cream, dun, champagne, dapple, flaxen):
+    """Return the basic color name for a horse from the codes its base color genes express
+    (see expressed_allele).
+
+    Args:
+        kit (str): W or w+.
+        ext, agouti, cream, dun, champagne, dapple, flaxen (str): See non_white_color.
+
+    Returns:
+        str. Basic color pattern of the horse.
+    """
+    if kit == 'W':
+        return 'white'
+    return non_white_color(ext, agouti, cream, dun, champagne, dapple, flaxen)
+
+
 def non_white_color(ext, agouti, cream, dun, champagne, dapple, flaxen):
     """Return the basic color name for the horse that is not white.
 
@@ -230,61 +276,92 @@ def non_white_color(ext, agouti, cream, dun, champagne, dapple, flaxen):
                         return 'flaxen chestnut'
 
 
-def hair_additions(chromo1, chromo2):
-    """Return the name of the coat pattern resulting from the addition of hairs resulting
-    from the sooty, rabicano, kit, overo, splashed white, and leopard complex genes."""
-    # Determine if the horse is white
-    kit = [ge.discrete_allele(cr, 'kit') for cr in (chromo1, chromo2)]
-    if 'W' in kit:
-        return ''
-
-    output = ''
+def expressed_pattern_allele(gene_name, alleles):
+    """Return the allele code that a pair of alleles of a coat pattern gene express.
 
-    sooty = 'sty'
-    if 'Sty' in [ge.discrete_allele(cr, 'sooty') for cr in (chromo1, chromo2)]:
-        sooty = 'Sty'
+    Args:
+        gene_name (str): kit, sooty, rabicano, overo, splashed, leopard_complex, pattern1 or
+            pattern2.
+        alleles (tuple): The allele of the gene on each chromosome.
 
-    rabi = 'rb'
-    if 'Rb' in [ge.discrete_allele(cr, 'rabicano') for cr in (chromo1, chromo2)]:
-        rabi = 'Rb'
+    Returns:
+        str. The code hair_additions takes for the gene.
+    """
+    if gene_name == 'kit':
+        if 'W' in alleles:
+            return 'W'
+        kit = sorted(set(alleles) - {'w+'})
+        return '/'.join(kit) if kit else 'w+'
+    if gene_name == 'leopard_complex':
+        if 'lp' not in alleles:
+            return 'LpLp'
+        return 'Lp' if 'Lp' in alleles else 'lp'
+    # The other genes have one allele which shows if either chromosome has it
+    shown = {'sooty': 'Sty', 'rabicano': 'Rb', 'overo': 'O', 'splashed': 'spl',
+             'pattern1': 'PATN1', 'pattern2': 'PATN2'}[gene_name]
+    if shown in alleles:
+        return shown
+    gene = ge.GENES[gene_name]
+    return [allele for allele in [gene['broken']] + gene['alleles'] if allele != shown][0]
 
-    overo = 'o'
-    if 'O' in [ge.discrete_allele(cr, 'overo') for cr in (chromo1, chromo2)]:
-        overo = 'O'
 
-    splash = 'Spl'
-    if 'spl' in [ge.discrete_allele(cr, 'splashed') for cr in (chromo1, chromo2)]:
-        splash = 'spl'
+def hair_additions(kit, sooty, rabicano, overo, splashed, leopard, pattern1, pattern2):
+    """Return the name of the coat pattern resulting from the addition of hairs resulting
+    from the sooty, rabicano, kit, overo, splashed white, and leopard complex genes.
 
-    sabino = 'sb'
-    if 'Sb' in kit:
-        sabino = 'Sb'
+    Args:
+        kit (str): W, w+ or the kit patterns (Sb, Rn, Tb) joined by / (e.g. Rn/Sb).
+        sooty (str): sty, Sty.
+        rabicano (str): rb, Rb.
+        overo (str): o, O.
+        splashed (str): Spl, spl.
+        leopard (str): lp, Lp, LpLp.
+        pattern1 (str): patn1, PATN1.
+        pattern2 (str): patn2, PATN2.
 
-    roan = 'rn'
-    if 'Rn' in kit:
-        roan = 'Rn'
+    Returns:
+        str. The patterns of the horse separated by spaces, empty if it has none or is white.
+    """
+    if kit == 'W':
+        return ''
 
-    tabino = 'tb'
-    if 'Tb' in kit:
-        tabino = 'Tb'
+    patterns = []
+    if sooty == 'Sty':
+        patterns.append('sooty')
+    if rabicano == 'Rb':
+        patterns.append('rabicano')
+    patterns += kit_phenotype(kit)
+    if overo == 'O':
+        patterns.append('frame overo')
+    if splashed == 'spl':
+        patterns.append('splashed white')
 
-    leopard = 'LpLp'
-    ls = [ge.discrete_allele(cr, 'leopard_complex') for cr in (chromo1, chromo2)]
-    if 'lp' in ls:
-        if 'Lp' not in ls:
-            leopard = 'lp'
+    if leopard == 'Lp':
+        if pattern1 == 'PATN1':
+            patterns.append('leopard')
+        elif pattern2 == 'PATN2':
+            patterns.append('blanket')
         else:
-            leopard = 'Lp'
+            patterns.append('varnish roan')
+    elif leopard == 'LpLp':
+        if pattern1 == 'PATN1':
+            patterns.append('fewspot')
+        elif pattern2 == 'PATN2':
+            patterns.append('snowcap')
+        else:
+            patterns.append('snowcap roan')
 
-    p1 = 'patn1'
-    if 'PATN1' in [ge.discrete_allele(cr, 'pattern1') for cr in (chromo1, chromo2)]:
-        p1 = 'PATN1'
+    return ' '.join(patterns)
 
-    p2 = 'patn2'
-    if 'PATN2' in [ge.discrete_allele(cr, 'pattern2') for cr in (chromo1, chromo2)]:
-        p2 = 'PATN2'
 
+def kit_phenotype(kit):
+    """Return the patterns generated by the KIT gene of a horse that is not white.
 
-def kit_phenotype(chromo1, chromo2):
-    """Return the phenotype generated by the KIT gene."""
-    kits = [ge.discrete_allele(cr, 'kit') for cr in (chromo1, chromo2)]
\ No newline at end of file
+    Args:
+        kit (str): w+ or the kit patterns (Sb, Rn, Tb) joined by / (e.g. Rn/Sb).
+
+    Returns:
+        list. Names of the patterns.
+    """
+    names = {'Sb': 'sabino', 'Rn': 'roan', 'Tb': 'tobiano'}
+    return [names[allele] for allele in kit.split('/') if allele in names]
@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+import table_operations as to
+import horse_functions as hf
+import race_functions as rf
+import game_calendar
+
+"""
+Horse valuation
+
+A horse is worth the races it can still be expected to run multiplied by how much it can
+be expected to win in each of them. That needs a few league-wide statistics (the age at
+which horses run their last race and how many races are run each day) and, for each horse,
+its age and the race record of the horse and its ancestors.
+
+The league-wide statistics are the expensive part and barely move from one race to the
+next, so they are calculated at most once per game day. Everything about the horses
+themselves is looked up for many horses at once, so that a whole herd can be valued with a
+handful of queries (e.g. to show the values of the horses in the trade box).
+"""
+
+MAX_EXPECTED_RACES = 20  # No horse is valued on more races than this
+PEDIGREE_DEPTH = 2  # Generations of ancestors whose race records are taken into account
+PEDIGREE_WEIGHT = .25  # How much less each generation back counts towards expected winnings
+
+_league = {'key': None}
+
+
+def league_stats(day):
+    """
+    Return the league-wide statistics used for valuations, calculating them at most once
+    per game day (and database).
+    Args:
+        day (datetime): Current day.
+
+    Returns:
+        float. Mean age (in days) at which horses run their last race.
+        float. Average number of races run per day.
+    """
+    key = (to.db, pd.Timestamp(day))
+    if _league['key'] != key:
+        race_life, _ = hf.expected_race_life()
+        _league.update(key=key, race_life=race_life, races_per_day=rf.races_per_day())
+    return _league['race_life'], _league['races_per_day']
+
+
+def ages(horse_ids, day):
+    """Return a Series of the ages (in days) of the horses, indexed by horse_id."""
+    query = f"SELECT horse_id, ? - birth_date AS age FROM horses WHERE horse_id IN {to.qmark_list(len(horse_ids))}"
+    ages = to.query_to_dataframe(query, [game_calendar.day_number(day)] + horse_ids)
+    return ages.set_index('horse_id')['age']
+
+
+def expected_winnings(horse_ids):
+    """
+    Return how much money each horse is expected to earn per race (see
+    horse_functions.expected_winnings). The race records of the horse and its ancestors
+    are pooled, with each generation back counting PEDIGREE_WEIGHT times as much.
+    Args:
+        horse_ids (list): IDs of the horses.
+
+    Returns:
+        pd.Series. Indexed by horse_id.
+    """
+    query = f"""
+    WITH RECURSIVE
+    family (horse_id, relative, depth) AS (
+        SELECT horse_id, horse_id, 0 FROM all_horses WHERE horse_id IN {to.qmark_list(len(horse_ids))}
+        UNION ALL
+        SELECT horse_id, (SELECT sire FROM all_horses WHERE horse_id = f.relative), depth + 1
+        FROM family f WHERE depth < ? AND relative IS NOT NULL
+        UNION ALL
+        SELECT horse_id, (SELECT dam FROM all_horses WHERE horse_id = f.relative), depth + 1
+        FROM family f WHERE depth < ? AND relative IS NOT NULL),
+    records (horse_id, races, winnings) AS (
+        SELECT horse_id, COUNT(*), SUM(winnings) FROM all_race_results
+        WHERE horse_id IN (SELECT relative FROM family)
+        GROUP BY horse_id)
+    SELECT f.horse_id, f.depth, IFNULL(r.races, 0) AS races, IFNULL(r.winnings, 0) AS winnings
+    FROM family f LEFT JOIN records r ON r.horse_id = f.relative
+    WHERE f.relative IS NOT NULL
+    ORDER BY f.horse_id, f.depth, f.relative
+    """
+    # The parents are looked up one horse at a time (rather than joined), so that only the
+    # rows needed are read from each of the tables behind all_horses
+    family = to.query_to_dataframe(query, list(horse_ids) + [PEDIGREE_DEPTH] * 2)
+    weight = PEDIGREE_WEIGHT ** family['depth']
+    winnings = (weight * family['winnings']).groupby(family['horse_id']).sum()
+    races = (weight * family['races']).groupby(family['horse_id']).sum()
+    return (winnings / races.replace(0, np.nan)).fillna(0.)
+
+
+def horse_values(horse_ids, day):
+    """
+    Return the estimated values of several horses (see owner_functions.horse_value).
+    Args:
+        horse_ids (list): IDs of the horses to evaluate.
+        day (datetime): Current day.
+
+    Returns:
+        pd.Series. How many dollars each horse is estimated to be worth, indexed by horse_id.
+    """
+    horse_ids = [int(h) for h in horse_ids]
+    if len(horse_ids) == 0:
+        return pd.Series(dtype=float, name='value')
+    race_life, races_per_day = league_stats(day)
+    remaining_life = (race_life - ages(horse_ids, day)).clip(lower=0).fillna(0.)
+    expected_races = (remaining_life / races_per_day).clip(upper=MAX_EXPECTED_RACES)
+    values = expected_races * expected_winnings(horse_ids)
+    return values.reindex(horse_ids).rename('value')
+
+
+def horse_value(horse_id, day):
+    """Return the estimated value of a single horse."""
+    return float(horse_values([horse_id], day).iloc[0])